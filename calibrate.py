@@ -10,8 +10,8 @@ from classes.experiment.eyetracker import EyeTracker
 from classes.utilities.settings import settings
 
 
-mon = monitors.Monitor('myMonitor', width=settings["monitor"]["width"], distance=settings["monitor"]["distance"])
-win = visual.Window(size=settings["monitor"]["resolution"], 
+mon = monitors.Monitor('myMonitor', width=settings.monitor.width, distance=settings.monitor.distance)
+win = visual.Window(size=settings.monitor.resolution, 
                                  fullscr=True, 
                                  monitor=mon, 
                                  units="pix", 
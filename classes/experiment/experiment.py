@@ -4,34 +4,54 @@
 # Experiment class for the current smooth pursuit experiment
 
 # Libraries
-from collections import OrderedDict
+from collections import ChainMap
+from collections.abc import Iterable, Sized
 import csv
 from datetime import datetime
 import hashlib
+from itertools import chain, product
+from numbers import Integral, Real
+from operator import itemgetter
 import os
 from psychopy import core, event, gui, visual, monitors
+import queue
 import random
+from struct import Struct, error as StructError
+import threading
+import types
 
 
 # Local imports
-from classes.experiment.experiment_section import ExperimentSection, SPTrialTutorial, SPTrialSection
+from classes.experiment.experiment_section import CONTINUE_KEY, ExperimentSection, SPTrialTutorial, SPTrialSection
 from classes.experiment.eyetracker import EyeTracker
-from classes.utilities.settings import settings
+from classes.utilities.data_log import CSV_ROW_FORMAT, convert_data_log_to_csv, read_data_log_header, write_data_log_rows
+from classes.utilities.settings import settings, text_settings
+
+# Size of the write buffer for csv files (bytes)
+DATA_FILE_BUFFER_SIZE = 1 << 16
+# Number of rows packed in memory before they are written to the data log
+DATA_LOG_BUFFER_ROWS = 4096
+# Minimum time between two handled clicks in the stimulus showcase (seconds)
+CLICK_DEBOUNCE_SECONDS = 0.2
 
 
 class Experiment:
     def __init__(self, 
                  name: str, # Name of the experiment
                  data_path: str, # Path to save data
-                 settings: dict, # Settings dict should be a json file that includes all settings for the experiment
-                 monitor_key: str = "monitor" # Key for the monitor settings in the settings dict
+                 settings: types.SimpleNamespace, # Settings loaded from a json file that includes all settings for the experiment
+                 monitor_key: str = "monitor" # Name of the monitor settings in the settings
                  ): 
         self.name = name
         self.data_path = data_path
         self.settings = settings
         self.monitor_key = monitor_key
-        self.data = OrderedDict(self.settings["experiment"]["data"].copy()) # Data should be a dict
+        self.data = dict(vars(self.settings.experiment.data)) # Data should be a dict
         self.data["experiment_name"] = name
+        self.constant_columns = [] # Columns of self.data that do not change during the session and are not written per row
+        self.flush_every_section = getattr(self.settings.experiment, "flush_every_section", True) # Sync the data file to disk whenever rows are written
+        self.write_every_n_sections = getattr(self.settings.experiment, "write_every_n_sections", 1) # Number of sections to collect before writing their rows
+        self._pending_rows = [] # Rows of sections that have not been written yet, one list per section
         self.experiment_clock = core.Clock()
 
     def setup_sections(self) -> None:
@@ -46,16 +66,178 @@ class Experiment:
         self.filename = "filename" # Should be string WITHOUT extension
 
     def create_data_file(self) -> None:
-        """Creates a data file for the experiment"""
-        with open(f"{self.data_path}/{self.filename}.csv", "w", newline="") as f:
-            writer = csv.writer(f)
-            writer.writerow(self.data.keys()) # Write column names to file
+        """Creates a binary data log for the experiment and keeps it open for writing rows.
+        The log is converted to the csv data file in finalize_experiment, or when the session is aborted.
+        It starts with a line of column names and, once the first row is written, a line with the struct format of a row.
+        Rows with non-numeric columns cannot be packed, their log has the format line "csv" followed by csv text rows"""
+        self._data_file_path = os.path.join(self.data_path, f"{self.filename}.csv")
+        self._data_log_path = os.path.join(self.data_path, f"{self.filename}_data.log")
+        self._data_fh = open(self._data_log_path, "wb", buffering=0)
+        self._row_indices = [i for i, key in enumerate(self.data) if key not in self.constant_columns] # Positions of the written columns in a row
+        self._row_struct = None # Created from the first row that is written
+        self._text_rows = False # Set if the first row has non-numeric columns
+        self.start_data_writer()
+        header = ",".join([self.escape_field(str(key)) for key in self.data.keys() if key not in self.constant_columns]) + "\n"
+        self.write_to_data_log(header.encode("utf-8")) # Write column names to file
+
+    @staticmethod
+    def escape_field(value: str) -> str:
+        """Quotes a string field the way csv.writer does"""
+        if any(char in value for char in ',"\r\n'):
+            return '"' + value.replace('"', '""') + '"'
+        return value
+
+    def format_text_row(self, row: list) -> str:
+        """Formats the written columns of a row as a csv line the way csv.writer does"""
+        return ",".join(["" if row[i] is None else self.escape_field(str(row[i])) for i in self._row_indices]) + "\r\n"
+
+    def setup_row_struct(self, row: list) -> None:
+        """Creates the struct used to pack rows shaped like row and writes its format to the data log.
+        If a column is not numeric, rows are written as csv text instead.
+        Later rows that do not fit the struct switch the log to csv text rows, see switch_to_text_rows"""
+        row_format = "<"
+        for i in self._row_indices:
+            value = row[i]
+            if isinstance(value, Integral):
+                row_format += "q"
+            elif isinstance(value, Real):
+                row_format += "d"
+            else:
+                self._text_rows = True
+                self.write_to_data_log((CSV_ROW_FORMAT + "\n").encode("ascii"))
+                return
+        self._row_struct = Struct(row_format)
+        self._get_row_values = itemgetter(*self._row_indices) if len(self._row_indices) > 1 else lambda row: (row[self._row_indices[0]],)
+        self._data_buffer = bytearray(self._row_struct.size * DATA_LOG_BUFFER_ROWS)
+        self._buffered_rows = 0
+        self.write_to_data_log((row_format + "\n").encode("ascii"))
     
-    def write_row_to_data_file(self, row: list) -> None:
-        """Writes a row of data to the data file"""
-        with open(f"{self.data_path}/{self.filename}.csv", "a", newline="") as f:
-            writer = csv.writer(f)
-            writer.writerows(row)
+    def switch_to_text_rows(self) -> None:
+        """Rewrites the packed rows of the data log as csv text rows, later rows are written as text too"""
+        self.flush_data_buffer()
+        self._data_fh.close()
+        header, row_format, offset = read_data_log_header(self._data_log_path)
+        text_log_path = self._data_log_path + ".tmp"
+        with open(text_log_path, "wb") as f:
+            f.write(f"{header}\n{CSV_ROW_FORMAT}\n".encode("utf-8"))
+            write_data_log_rows(self._data_log_path, f, row_format, offset)
+        os.replace(text_log_path, self._data_log_path)
+        self._data_fh = open(self._data_log_path, "ab", buffering=0)
+        self._row_struct = None
+        self._text_rows = True
+
+    def write_text_rows(self, rows: Iterable) -> None:
+        """Writes rows as csv text rows to the data log"""
+        format_text_row = self.format_text_row
+        self.write_to_data_log("".join([format_text_row(r) for r in rows]).encode("utf-8"))
+
+    def write_row_to_data_file(self, row: Iterable) -> None:
+        """Packs the rows of a section into the data log buffer, row can be any iterable of rows"""
+        rows = iter(row)
+        first_row = next(rows, None)
+        if first_row is None:
+            return
+        if self._row_struct is None and not self._text_rows:
+            self.setup_row_struct(first_row)
+        if self._text_rows:
+            self.write_text_rows(chain((first_row,), rows))
+            return
+        pack_into = self._row_struct.pack_into
+        row_size = self._row_struct.size
+        get_row_values = self._get_row_values
+        for r in chain((first_row,), rows):
+            try:
+                pack_into(self._data_buffer, self._buffered_rows * row_size, *get_row_values(r))
+            except StructError:
+                # A value does not fit its column type (e.g. a float after an int), no row is dropped
+                self.switch_to_text_rows()
+                self.write_text_rows(chain((r,), rows))
+                return
+            self._buffered_rows += 1
+            if self._buffered_rows == DATA_LOG_BUFFER_ROWS:
+                self.flush_data_buffer()
+
+    def write_to_data_log(self, data: bytes) -> None:
+        """Writes all bytes to the unbuffered data log"""
+        view = memoryview(data)
+        while view:
+            view = view[self._data_fh.write(view):]
+
+    def flush_data_buffer(self) -> None:
+        """Writes the buffered rows to the data log"""
+        if self._row_struct is None or not self._buffered_rows:
+            return
+        self.write_to_data_log(memoryview(self._data_buffer)[:self._buffered_rows * self._row_struct.size])
+        self._buffered_rows = 0
+
+    def start_data_writer(self) -> None:
+        """Starts the thread that writes the rows of finished sections to the data log"""
+        self._write_queue = queue.Queue()
+        self._data_writer_error = None
+        self._data_writer = threading.Thread(target=self.data_writer, daemon=True)
+        self._data_writer.start()
+
+    def data_writer(self) -> None:
+        """Writes the lists of section rows put in the write queue until None is put"""
+        while True:
+            sections = self._write_queue.get()
+            try:
+                if sections is None:
+                    return
+                if self._data_writer_error is None: # Stop writing after an error, it is raised in the main thread
+                    self.write_sections(sections)
+            except Exception as e:
+                self._data_writer_error = e
+            finally:
+                self._write_queue.task_done()
+
+    def wait_for_data_writer(self) -> None:
+        """Blocks until the data writer has written everything that was queued"""
+        self._write_queue.join()
+        if self._data_writer_error is not None:
+            raise self._data_writer_error
+
+    def write_sections(self, sections: list) -> None:
+        """Writes the rows of sections to the data log"""
+        for rows in sections:
+            self.write_row_to_data_file(rows)
+        if self.flush_every_section:
+            self.sync_data_file()
+
+    def write_pending_rows(self) -> None:
+        """Writes the rows of all collected sections to the data log.
+        Lists of rows are written by the data writer thread, lazy iterables are consumed here because they run section code"""
+        if not self._pending_rows:
+            return
+        sections, self._pending_rows = self._pending_rows, []
+        if all(isinstance(rows, Sized) for rows in sections):
+            # Raise a failed write now instead of at the end of the session
+            if self._data_writer_error is not None:
+                raise self._data_writer_error
+            self._write_queue.put(sections)
+        else:
+            self.wait_for_data_writer()
+            self.write_sections(sections)
+
+    def sync_data_file(self) -> None:
+        """Flushes the data log and makes sure it is written to disk"""
+        self.flush_data_buffer()
+        os.fsync(self._data_fh.fileno())
+
+    def close_data_file(self) -> None:
+        """Writes outstanding rows, then flushes and closes the data log"""
+        if getattr(self, "_data_fh", None) is not None and not self._data_fh.closed:
+            try:
+                self.write_pending_rows()
+                self.wait_for_data_writer()
+            finally:
+                # Stop the writer and close the log even if writing failed, an open log cannot be removed on Windows
+                self._write_queue.put(None) # Stop the data writer
+                self._data_writer.join()
+                try:
+                    self.flush_data_buffer()
+                finally:
+                    self._data_fh.close()
 
     def prepare_experiment(self) -> None:
         """Functions that should be run before the main section loop"""
@@ -63,27 +245,45 @@ class Experiment:
         self.setup_filename()
         self.create_data_file()
     
+    def save_data_file(self) -> None:
+        """Closes the data log and converts it to the csv data file, the log is converted even if closing fails"""
+        try:
+            self.close_data_file()
+        finally:
+            data_log_path = getattr(self, "_data_log_path", None)
+            if data_log_path is not None and os.path.exists(data_log_path):
+                convert_data_log_to_csv(data_log_path, self._data_file_path)
+                os.remove(data_log_path)
+
     def finalize_experiment(self) -> None:
         """Functions that should be run after the main section loop"""
-        pass
+        self.save_data_file()
 
     def run(self) -> None:
         """Prepares, runs, and finalizes the experiment"""
-        # Prepare
-        self.prepare_experiment()
-
-        # Run
-        print("########################")
-        print("Runing through sections...")
-        for section in self.sections:
-            print(section.name)
-            rows = section.run() # Run section and get data
-            if rows is None:
-                continue
-            elif not isinstance(rows, list):
-                raise Exception("Section must return a list or None")
-            else:
-                self.write_row_to_data_file(rows) # Write data to file
+        try:
+            # Prepare
+            self.prepare_experiment()
+
+            # Run
+            print("########################")
+            print("Runing through sections...")
+            for section in self.sections:
+                print(section.name)
+                rows = section.run() # Run section and get data, an iterable of rows or None
+                if rows is None:
+                    continue
+                self._pending_rows.append(rows)
+                # Lazy iterables (e.g. generators) are written right away so they are consumed while the section runs
+                if not isinstance(rows, Sized) or len(self._pending_rows) >= self.write_every_n_sections:
+                    self.write_pending_rows() # Write data to file
+        except BaseException:
+            # Aborted sessions (quit key, EyeLink errors exit the process) still get a csv of the rows written so far
+            try:
+                self.save_data_file()
+            except Exception as error:
+                print('ERROR:', error) # The exception that aborted the session is raised instead
+            raise
 
         # Finalize
         self.finalize_experiment() 
@@ -92,19 +292,18 @@ class Experiment:
 class SPExperiment(Experiment):
     def __init__(self, name = "sp_experiment", data_path="data", settings=settings, monitor_key="monitor"):
         super().__init__(name, data_path, settings, monitor_key)
-        self.data["target_radius"] = settings["stimuli"]["targets"]["radius"]
-        self.data["target_color"] = settings["stimuli"]["targets"]["fillColor"]
+        self.data["target_radius"] = settings.stimuli.targets.radius
+        self.data["target_color"] = settings.stimuli.targets.fillColor
+        self.constant_columns = ["experiment_name", "participant_id", "target_radius", "target_color"] # Written once to the participant info file
         self.participant_data = {}
         self.participant_data["experiment_name"] = name
 
     def generate_participant_id(self) -> None:
         """Generates a 8 character participant id from the current datetime"""
-        sha256_hash = hashlib.sha256()
         time = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
-        sha256_hash.update(time.encode('utf-8'))
-        hex_digest = sha256_hash.hexdigest()
-        self.data["participant_id"] = hex_digest[:8]
-        self.participant_data["participant_id"] = hex_digest[:8]
+        participant_id = hashlib.sha256(time.encode('utf-8')).hexdigest()[:8]
+        self.data["participant_id"] = participant_id
+        self.participant_data["participant_id"] = participant_id
         
     def get_participant_info(self) -> None:
         # open gui to get participant info
@@ -132,26 +331,28 @@ class SPExperiment(Experiment):
     
     def update_data_path(self) -> None:
         """Creates a new data path using the participant id"""
-        if not os.path.exists(f"{self.data_path}/{self.data['participant_id']}"):
-            os.makedirs(f"{self.data_path}/{self.data['participant_id']}")
-        else:
+        data_path = f"{self.data_path}/{self.data['participant_id']}"
+        try:
+            os.makedirs(data_path, exist_ok=False)
+        except FileExistsError:
             raise Exception("Participant ID already exists")
-        self.data_path = f"{self.data_path}/{self.data['participant_id']}"
+        self.data_path = data_path
 
     def setup_filename(self) -> None:
         """Sets filename using participant id"""
         self.filename = self.data["participant_id"] # EDF file can only be 8 characters long -> participant id is 8 characters long
 
     def create_participant_data_file(self) -> None:
-        """Writes participant info to a csv"""
-        with open(f"{self.data_path}/{self.filename}_participant_info.csv", "w", newline="") as f:
+        """Writes participant info and the constant columns of the data file to a csv"""
+        participant_data = {**self.participant_data, **{column: self.data[column] for column in self.constant_columns}}
+        with open(os.path.join(self.data_path, f"{self.filename}_participant_info.csv"), "w", newline="", buffering=DATA_FILE_BUFFER_SIZE) as f:
             writer = csv.writer(f)
-            writer.writerow(self.participant_data.keys()) # Write column names to file
-            writer.writerow(self.participant_data.values()) # Write column values to file
+            writer.writerow(participant_data.keys()) # Write column names to file
+            writer.writerow(participant_data.values()) # Write column values to file
 
     def setup_window(self) -> None:
-        mon = monitors.Monitor('myMonitor', width=settings[self.monitor_key]["width"], distance=settings[self.monitor_key]["distance"])
-        self.win = visual.Window(size=settings[self.monitor_key]["resolution"], 
+        mon = monitors.Monitor('myMonitor', width=getattr(settings, self.monitor_key).width, distance=getattr(settings, self.monitor_key).distance)
+        self.win = visual.Window(size=getattr(settings, self.monitor_key).resolution, 
                                  fullscr=True, 
                                  monitor=mon, 
                                  units="pix", 
@@ -164,7 +365,7 @@ class SPExperiment(Experiment):
         self.el_tracker = EyeTracker(win=self.win, 
                                        filename=self.filename,
                                        data_path=self.data_path,
-                                       dummy_mode=settings["tracker"]["settings"]["dummy_mode"])
+                                       dummy_mode=settings.tracker.settings.dummy_mode)
         self.el_tracker.connect_to_eyetracker()
         self.el_tracker.open_edf_file()
         self.el_tracker.configure_eyetracker()
@@ -173,47 +374,45 @@ class SPExperiment(Experiment):
         self.el_tracker.prepare_calibration()
         
         visual.TextStim(self.win, 
-                        text=settings["tracker"]["calibration"]["instruction"], 
-                        height=settings["stimuli"]["text"]["height"],
-                        wrapWidth=settings["stimuli"]["text"]["wrapWidth"],
-                        color=settings["stimuli"]["text"]["color"],
-                        units=settings["stimuli"]["text"]["units"],
-                        pos=settings["stimuli"]["text"]["pos"]).draw()
+                        text=settings.tracker.calibration.instruction, 
+                        height=text_settings.height,
+                        wrapWidth=text_settings.wrapWidth,
+                        color=text_settings.color,
+                        units=text_settings.units,
+                        pos=text_settings.pos).draw()
         self.win.flip()
-        event.waitKeys(keyList=[settings["controls"]["continue"]])
+        event.waitKeys(keyList=[CONTINUE_KEY])
         self.el_tracker.calibrate()
 
     def create_section_data_file(self) -> None:
         """Creates an overview of the sections in this session."""
-        header = settings["experiment"]["section_data"]
-        rows = []
-        for section in self.sections:
-            rows.append([self.name, self.data["participant_id"], section.name, section.data["trial_number"], section.data["target_type"], section.data["target_trajectory"], section.data["target_speed"], section.data["target_radius"], section.data["target_color"]])
-        with open(f"{self.data_path}/{self.filename}_section_info.csv", "w", newline="") as f:
+        header = vars(settings.experiment.section_data)
+        get_section_values = itemgetter("trial_number", "target_type", "target_trajectory", "target_speed", "target_radius", "target_color")
+        rows = [(self.name, self.data["participant_id"], section.name, *get_section_values(section.data)) for section in self.sections]
+        with open(os.path.join(self.data_path, f"{self.filename}_section_info.csv"), "w", newline="", buffering=DATA_FILE_BUFFER_SIZE) as f:
             writer = csv.writer(f)
             writer.writerow(header)
             writer.writerows(rows)
 
     def setup_sections(self) -> None:
         """Sets up all sections of the experiment"""
-        target_types = settings["experiment"]["trials"]["target_types"]
-        target_speeds = settings["experiment"]["trials"]["target_speeds"]
-        target_trajectories = settings["experiment"]["trials"]["target_trajectories"]
+        target_types = settings.experiment.trials.target_types
+        target_speeds = settings.experiment.trials.target_speeds
+        target_trajectories = settings.experiment.trials.target_trajectories
+        template = dict(self.data) # Shared by all sections, each section only stores its own changes
         sections = []
-        for i in range(settings["experiment"]["trials"]["repetitions"]):
+        for i in range(settings.experiment.trials.repetitions):
             for speed in target_speeds:
-                speed_section = []
-                for target_trajectory in target_trajectories:
-                    for target_type in target_types:
-                        speed_section.append(SPTrialSection(name=None,
-                                                        data=self.data.copy(),
-                                                        win=self.win,
-                                                        experiment_clock=self.experiment_clock,
-                                                        el_tracker=self.el_tracker, 
-                                                        trial_number=None, 
-                                                        target_type=target_type, 
-                                                        target_speed=speed, 
-                                                        target_trajectory=target_trajectory))             
+                speed_section = [SPTrialSection(name=None,
+                                                data=ChainMap({}, template),
+                                                win=self.win,
+                                                experiment_clock=self.experiment_clock,
+                                                el_tracker=self.el_tracker, 
+                                                trial_number=None, 
+                                                target_type=target_type, 
+                                                target_speed=speed, 
+                                                target_trajectory=target_trajectory)
+                                 for target_trajectory, target_type in product(target_trajectories, target_types)]
                 random.shuffle(speed_section)
                 sections += speed_section
         # Add Trial Name and Number
@@ -224,7 +423,7 @@ class SPExperiment(Experiment):
                 section.data["trial_number"] = i
                 i+=1
         self.sections = [SPTrialTutorial("Tutorial", 
-                                         self.data.copy(), 
+                                         ChainMap({}, template), 
                                          self.experiment_clock, 
                                          self.win, self.el_tracker)] + sections
 
@@ -257,6 +456,7 @@ class SPExperiment(Experiment):
     
     def finalize_experiment(self) -> None:
         """Functions that should be run after the main section loop"""
+        super().finalize_experiment() # end_session exits the process
         self.el_tracker.end_session()
 
 
@@ -267,19 +467,20 @@ class StimulusShowcase:
         self.settings = settings
         self.monitor_key = monitor_key
         self.running = True
-        self.data = settings["experiment"]["data"].copy()
+        self.data = dict(vars(settings.experiment.data))
         self.experiment_clock = core.Clock()
 
         self.setup_window()
         self.setup_eyetracker()
         self.setup_interface()
+        self.setup_section_pool()
 
     def setup_window(self):
         mon = monitors.Monitor('myMonitor',
-                               width=self.settings[self.monitor_key]["width"],
-                               distance=self.settings[self.monitor_key]["distance"])
+                               width=getattr(self.settings, self.monitor_key).width,
+                               distance=getattr(self.settings, self.monitor_key).distance)
         self.win = visual.Window(
-            size=self.settings[self.monitor_key]["resolution"],
+            size=getattr(self.settings, self.monitor_key).resolution,
             fullscr=False,
             pos = (0, 0),
             screen=0,
@@ -295,7 +496,7 @@ class StimulusShowcase:
             win=self.win,
             filename="showcase",
             data_path=self.data_path,
-            dummy_mode=self.settings["tracker"]["settings"]["dummy_mode"]
+            dummy_mode=self.settings.tracker.settings.dummy_mode
         )
         self.el_tracker.connect_to_eyetracker()
         self.el_tracker.open_edf_file()
@@ -304,26 +505,27 @@ class StimulusShowcase:
 
         visual.TextStim(
             self.win,
-            text=self.settings["tracker"]["calibration"]["instruction"],
-            height=self.settings["stimuli"]["text"]["height"],
-            wrapWidth=self.settings["stimuli"]["text"]["wrapWidth"],
-            color=self.settings["stimuli"]["text"]["color"],
-            units=self.settings["stimuli"]["text"]["units"],
-            pos=self.settings["stimuli"]["text"]["pos"]
+            text=self.settings.tracker.calibration.instruction,
+            height=self.settings.stimuli.text.height,
+            wrapWidth=self.settings.stimuli.text.wrapWidth,
+            color=self.settings.stimuli.text.color,
+            units=self.settings.stimuli.text.units,
+            pos=self.settings.stimuli.text.pos
         ).draw()
         self.win.flip()
-        event.waitKeys(keyList=[self.settings["controls"]["continue"]])
+        event.waitKeys(keyList=[CONTINUE_KEY])
         self.el_tracker.calibrate()
 
     def setup_interface(self):
         self.mouse = event.Mouse(visible=True, win=self.win)
-        self.target_types = self.settings["experiment"]["trials"]["target_types"]
-        self.target_trajectories = self.settings["experiment"]["trials"]["target_trajectories"]
-        self.speed_options = self.settings["experiment"]["trials"]["target_speeds"]
+        self.target_types = self.settings.experiment.trials.target_types
+        self.target_trajectories = self.settings.experiment.trials.target_trajectories
+        self.speed_options = self.settings.experiment.trials.target_speeds
         self.selected_type = self.target_types[0]
         self.selected_trajectory = self.target_trajectories[0]
         self.selected_speed = self.speed_options[0]
         self.tutorial_checked = False
+        self._last_click = 0.0 # Time of the last handled click, used to debounce the mouse
         
         self.info_text = visual.TextStim(self.win, text=f"Click on 'Type', 'Speed', and 'Trajectory' to adjust them.\nCheck 'Tutorial' if you want to run it first.\nClick 'Run' to se the trial.", pos=(0, 250), height=24)
         self.speed_text = visual.TextStim(self.win, text=f"Speed: {self.selected_speed}", pos=(0, 100), height=24)
@@ -336,12 +538,45 @@ class StimulusShowcase:
             "quit": self.make_button("Quit", (-150, -150))
         }
 
+        # Bounding boxes of clickable widgets, text boxes are updated when their text changes
+        self._widget_boxes = {
+            "checkbox": self.widget_box(self.checkbox_text),
+            "type": self.widget_box(self.type_text),
+            "traj": self.widget_box(self.traj_text),
+            "speed": self.widget_box(self.speed_text)
+        }
+        for name, button in self.buttons.items():
+            self._widget_boxes[name] = self.widget_box(button["rect"])
+
+        # Widgets that cycle through options when clicked: (name, widget, attribute, options, text format)
+        self._cycles = [
+            ("type", self.type_text, "selected_type", self.target_types, "Type: {}"),
+            ("traj", self.traj_text, "selected_trajectory", self.target_trajectories, "Trajectory: {}"),
+            ("speed", self.speed_text, "selected_speed", self.speed_options, "Speed: {}")
+        ]
+        self._cycle_index = {attribute: 0 for _, _, attribute, _, _ in self._cycles} # Index of the selected option
+
     def make_button(self, label, pos):
         return {
             "rect": visual.Rect(self.win, width=100, height=50, pos=pos, fillColor='gray'),
             "text": visual.TextStim(self.win, text=label, pos=pos, height=20)
         }
 
+    @staticmethod
+    def widget_box(widget) -> tuple:
+        """Returns the axis aligned bounding box (x0, y0, x1, y1) of a centered widget"""
+        if isinstance(widget, visual.TextStim):
+            width, height = widget.boundingBox
+        else:
+            width, height = widget.width, widget.height
+        x, y = widget.pos
+        return (x - width / 2, y - height / 2, x + width / 2, y + height / 2)
+
+    def hit(self, name: str, widget, mouse_pos) -> bool:
+        """Checks if the mouse is on a widget, the exact contains test only runs inside the bounding box"""
+        x0, y0, x1, y1 = self._widget_boxes[name]
+        return x0 <= mouse_pos[0] <= x1 and y0 <= mouse_pos[1] <= y1 and widget.contains(mouse_pos)
+
     def draw_interface(self):
         self.info_text.draw()
         self.speed_text.draw()
@@ -354,35 +589,27 @@ class StimulusShowcase:
         self.win.flip()
 
     def handle_interaction(self):
-        if self.mouse.getPressed()[0]:
+        now = self.experiment_clock.getTime()
+        if self.mouse.getPressed()[0] and now - self._last_click > CLICK_DEBOUNCE_SECONDS:
+            self._last_click = now
             mouse_pos = self.mouse.getPos()
 
-            if self.checkbox_text.contains(mouse_pos):
+            if self.hit("checkbox", self.checkbox_text, mouse_pos):
                 self.tutorial_checked = not self.tutorial_checked
                 self.checkbox_text.text = "[x] Tutorial" if self.tutorial_checked else "[ ] Tutorial"
-                core.wait(0.2)
-
-            if self.type_text.contains(mouse_pos):
-                i = self.target_types.index(self.selected_type)
-                self.selected_type = self.target_types[(i + 1) % len(self.target_types)]
-                self.type_text.text = f"Type: {self.selected_type}"
-                core.wait(0.2)
-
-            if self.traj_text.contains(mouse_pos):
-                i = self.target_trajectories.index(self.selected_trajectory)
-                self.selected_trajectory = self.target_trajectories[(i + 1) % len(self.target_trajectories)]
-                self.traj_text.text = f"Trajectory: {self.selected_trajectory}"
-                core.wait(0.2)
-            
-            if self.speed_text.contains(mouse_pos):
-                i = self.speed_options.index(self.selected_speed)
-                self.selected_speed = self.speed_options[(i + 1) % len(self.speed_options)]
-                self.speed_text.text = f"Speed: {self.selected_speed}"
-                core.wait(0.2)
+                self._widget_boxes["checkbox"] = self.widget_box(self.checkbox_text)
+
+            for name, widget, attribute, options, text_format in self._cycles:
+                if self.hit(name, widget, mouse_pos):
+                    i = (self._cycle_index[attribute] + 1) % len(options)
+                    self._cycle_index[attribute] = i
+                    setattr(self, attribute, options[i])
+                    widget.text = text_format.format(options[i])
+                    self._widget_boxes[name] = self.widget_box(widget)
+                    break
 
             for name, button in self.buttons.items():
-                if button["rect"].contains(mouse_pos):
-                    core.wait(0.2)
+                if self.hit(name, button["rect"], mouse_pos):
                     return name
         return None
 
@@ -394,27 +621,38 @@ class StimulusShowcase:
             "tutorial": self.tutorial_checked
         }
 
-    def setup_sections(self, selection):
-        sections = []
-        if selection["tutorial"]:
-            sections.append(SPTrialTutorial(
-                name="Tutorial",
-                data=self.data.copy(),
-                experiment_clock=self.experiment_clock,
-                win=self.win,
-                el_tracker=self.el_tracker
-            ))
-        sections.append(SPTrialSection(
+    def setup_section_pool(self):
+        """Creates the tutorial and trial sections once, they are reconfigured for every run"""
+        self.tutorial = SPTrialTutorial(
+            name="Tutorial",
+            data=self.data.copy(),
+            experiment_clock=self.experiment_clock,
+            win=self.win,
+            el_tracker=self.el_tracker
+        )
+        self.trial = SPTrialSection(
             name="Trial",
             data=self.data.copy(),
             win=self.win,
             experiment_clock=self.experiment_clock,
             el_tracker=self.el_tracker,
             trial_number=1,
-            target_type=selection["target_type"],
-            target_speed=selection["target_speed"],
-            target_trajectory=selection["target_trajectory"]
-        ))
+            target_type=self.selected_type,
+            target_speed=self.selected_speed,
+            target_trajectory=self.selected_trajectory
+        )
+
+    def setup_sections(self, selection):
+        sections = []
+        if selection["tutorial"]:
+            self.tutorial.reset(data=self.data)
+            sections.append(self.tutorial)
+        self.trial.reset(data=self.data)
+        self.trial.reconfigure(trial_number=1,
+                               target_type=selection["target_type"],
+                               target_speed=selection["target_speed"],
+                               target_trajectory=selection["target_trajectory"])
+        sections.append(self.trial)
         self.sections = sections
 
     def run(self):
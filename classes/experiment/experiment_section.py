@@ -4,17 +4,135 @@
 # ExperimentSection classes for the current smooth pursuit experiment
 
 # Libraries
-from math import degrees, pi
+from functools import cached_property, lru_cache
+import numpy as np
 from psychopy import core, event, visual 
 from typing import List
 
 # Local imports
 from classes.experiment.eyetracker import EyeTracker
-from classes.experiment.stimulus import JumpingCircle, MovingCircle, BackAndForthArray
+from classes.experiment.stimulus import Stimulus, JumpingCircle, MovingCircle, BackAndForthArray
 from classes.experiment.trajectory import CircularTrajectory, HorizontalTrajectory, VerticalTrajectory, DiagonalTrajectory
-from classes.utilities.settings import settings
+from classes.utilities.settings import settings, text_settings
 from classes.utilities.utilities import Utilities
 
+# Key to continue, continue is a python keyword and cannot be read as an attribute
+CONTINUE_KEY = getattr(settings.controls, "continue")
+# Number of frames between two checks for the quit key while the target moves
+KEY_POLL_FRAMES = 8
+# Trajectory class and direction argument of each trajectory
+TRAJECTORIES = {"hor_right": (HorizontalTrajectory, "right"),
+                "hor_left": (HorizontalTrajectory, "left"),
+                "ver_up": (VerticalTrajectory, "up"),
+                "ver_down": (VerticalTrajectory, "down"),
+                "diag_up_right": (DiagonalTrajectory, "up_right"),
+                "diag_up_left": (DiagonalTrajectory, "up_left"),
+                "diag_down_right": (DiagonalTrajectory, "down_right"),
+                "diag_down_left": (DiagonalTrajectory, "down_left"),
+                "cir_clock": (CircularTrajectory, "clockwise"),
+                "cir_counter": (CircularTrajectory, "counterclockwise")}
+# Start position of each trajectory as a fraction of the moving distance
+TRAJECTORY_STARTS = {"hor_right": (-0.5, 0),
+                     "hor_left": (0.5, 0),
+                     "ver_up": (0, -0.5),
+                     "ver_down": (0, 0.5),
+                     "diag_up_right": (-0.5, -0.5),
+                     "diag_up_left": (0.5, -0.5),
+                     "diag_down_right": (-0.5, 0.5),
+                     "diag_down_left": (0.5, 0.5),
+                     "cir_clock": (-0.5, 0),
+                     "cir_counter": (0.5, 0)}
+# Direction of the straight trajectories, used for the instruction arrow
+TRAJECTORY_DIRECTIONS = {"hor_right": (1, 0),
+                         "hor_left": (-1, 0),
+                         "ver_up": (0, 1),
+                         "ver_down": (0, -1),
+                         "diag_up_right": (1, 1),
+                         "diag_up_left": (-1, 1),
+                         "diag_down_right": (1, -1),
+                         "diag_down_left": (-1, -1)}
+# Instruction texts
+TRAJECTORY_TEXTS = {"hor_right": "horizontally to the right",
+                    "hor_left": "horizontally to the left",
+                    "ver_up": "vertically upwards",
+                    "ver_down": "vertically downwards",
+                    "diag_up_right": "diagonally upwards to the right",
+                    "diag_up_left": "diagonally upwards to the left",
+                    "diag_down_right": "diagonally downwards to the right",
+                    "diag_down_left": "diagonally downwards to the left",
+                    "cir_clock": "in a clockwise circle",
+                    "cir_counter": "in a counterclockwise circle"}
+MOVEMENT_TEXTS = {"moving_circle": "moves consistently",
+                  "jumping_circle": "jumps",
+                  "back_and_forth_array": "jumps back and forth, while moving"}
+# Instruction text of each combination of target type and trajectory
+INSTRUCTION_TEXTS = {(target_type, trajectory): f"Fixate on the target as it {movement_text} {trajectory_text}.\n\nFixate the target, press {CONTINUE_KEY} to make the text disappear, and press {CONTINUE_KEY} again to start the trial."
+                     for target_type, movement_text in MOVEMENT_TEXTS.items()
+                     for trajectory, trajectory_text in TRAJECTORY_TEXTS.items()}
+
+class TrialPlan:
+    """Start position, speed, trajectory, and duration of a trial.
+    They only depend on the target type, speed, and trajectory, so they are computed once per combination"""
+    def __init__(self, target_type: str, target_speed: float, target_trajectory: str) -> None:
+        monitor = settings.monitor
+        targets = settings.stimuli.targets
+        speed_px = Utilities.deg_to_px(target_speed, monitor)
+        moving_distance = Utilities.deg_to_px(targets.moving_distance, monitor)
+        trajectory_class, direction = TRAJECTORIES[target_trajectory]
+        if trajectory_class is CircularTrajectory:
+            # One rotation covers 360 degrees whatever the viewing distance, so the trial lasts one rotation
+            self.req_sec = 360 / target_speed
+            self.speed = target_speed
+            self.trajectory = CircularTrajectory(radius=moving_distance/2, direction=direction, start=0, monitor=monitor)
+        else:
+            self.req_sec = min(moving_distance / speed_px, targets.max_seconds)
+            self.speed = speed_px
+            self.trajectory = trajectory_class(moving_distance, direction) # Trajectories only keep a reused position buffer, so trials share them
+        start_x, start_y = TRAJECTORY_STARTS[target_trajectory]
+        self.start_pos = (start_x*moving_distance, start_y*moving_distance)
+        self.target_type = target_type
+        self.jumping_frequency = round(monitor.refresh_rate / targets.jumps_per_second)
+
+    def make_stimulus(self, win: visual.Window) -> Stimulus:
+        """Creates the stimulus of the trial at its start position"""
+        radius = settings.stimuli.targets.radius
+        fill_color = settings.stimuli.targets.fillColor
+        line_color = settings.stimuli.targets.lineColor
+        if self.target_type == "moving_circle":
+            return MovingCircle(win=win, 
+                                pos=self.start_pos, 
+                                speed=self.speed, 
+                                trajectory=self.trajectory, 
+                                radius=radius, 
+                                fill_color=fill_color,
+                                line_color=line_color)
+        elif self.target_type == "jumping_circle":
+            return JumpingCircle(win=win, 
+                                 pos=self.start_pos, 
+                                 speed=self.speed, 
+                                 trajectory=self.trajectory, 
+                                 update_frequency=self.jumping_frequency,
+                                 radius=radius,
+                                 fill_color=fill_color,
+                                 line_color=line_color)
+        elif self.target_type == "back_and_forth_array":
+            return BackAndForthArray(win=win,
+                                     pos=self.start_pos,
+                                     speed=self.speed,
+                                     trajectory=self.trajectory,
+                                     update_frequency=self.jumping_frequency,
+                                     radius=radius,
+                                     element_sizes=2*radius, # double the radius to make the elements the same size as the other targets
+                                     element_colors=fill_color)
+        raise ValueError(f"Invalid target type ({self.target_type})")
+
+
+@lru_cache(maxsize=None)
+def get_trial_plan(target_type: str, target_speed: float, target_trajectory: str) -> TrialPlan:
+    """Returns the plan of a combination of target type, speed, and trajectory, it is only computed the first time"""
+    return TrialPlan(target_type, target_speed, target_trajectory)
+
+
 class ExperimentSection:
     def __init__(self, 
                  name: str, # Name of the section
@@ -39,21 +157,47 @@ class SPTextSection(ExperimentSection):
         self.win = win
         self.text = text
         self.align = align
+        self.text_stim = None # Built on the first run and reused when the section is shown again
     
     def run(self):
-        visual.TextStim(self.win, 
-                        text=self.text, 
-                        height=settings["stimuli"]["text"]["height"],
-                        wrapWidth=settings["stimuli"]["text"]["wrapWidth"],
-                        color=settings["stimuli"]["text"]["color"],
-                        units=settings["stimuli"]["text"]["units"],
-                        pos=(settings["stimuli"]["text"]["pos"][0], settings["stimuli"]["text"]["pos"][1]),
-                        alignText=self.align).draw()
+        if self.text_stim is None:
+            self.text_stim = visual.TextStim(self.win, 
+                                             text=self.text, 
+                                             height=text_settings.height,
+                                             wrapWidth=text_settings.wrapWidth,
+                                             color=text_settings.color,
+                                             units=text_settings.units,
+                                             pos=tuple(text_settings.pos),
+                                             alignText=self.align)
+        self.text_stim.draw()
         self.win.flip()
-        event.waitKeys(keyList=[settings["controls"]["continue"]])
+        event.waitKeys(keyList=[CONTINUE_KEY])
         return None
 
 
+class TrialRows:
+    """Rows of a trial, built from the static values of the section data and the values sampled each frame.
+    Rows are only built when they are iterated, which the experiment does when it writes them"""
+    def __init__(self, 
+                 row: list, # Values of all data columns
+                 sample_columns: List[int], # Positions in row of the sampled columns
+                 samples: np.ndarray) -> None: # One line of sampled values per frame
+        self.row = row
+        self.sample_columns = sample_columns
+        self.samples = samples
+
+    def __len__(self) -> int:
+        return len(self.samples)
+
+    def __iter__(self):
+        row = list(self.row)
+        sample_columns = self.sample_columns
+        for values in self.samples.tolist():
+            for i, value in zip(sample_columns, values):
+                row[i] = value
+            yield tuple(row)
+
+
 class SPTrialSection(ExperimentSection):
     def __init__(self, 
                 name: str,
@@ -76,179 +220,87 @@ class SPTrialSection(ExperimentSection):
         self.data["target_speed"] = target_speed
         self.data["target_trajectory"] = target_trajectory
         self.time_offset = time_offset
+        self.stimulus = None # Built by initialize_stimulus when the section is run
+        self.instruction_text = None # Built once by setup_instruction_stimuli and reused for every instruction screen
+        self.instruction_arrow = None
+
+    def reset(self, data: dict) -> None:
+        """Replaces the section data with a copy of data, keeping the trial settings of this section"""
+        trial_settings = {key: self.data[key] for key in ("section", "trial_number", "target_type", "target_speed", "target_trajectory")}
+        self.data = dict(data)
+        self.data.update(trial_settings)
+
+    def reconfigure(self, trial_number: int, target_type: str, target_speed: float, target_trajectory: str) -> None:
+        """Changes the trial settings so the section can be run again.
+        The stimulus is only rebuilt if the settings changed"""
+        if (target_type, target_speed, target_trajectory) != (self.data["target_type"], self.data["target_speed"], self.data["target_trajectory"]):
+            self.stimulus = None
+            self.__dict__.pop("instruction_settings", None) # Computed again for the new settings
+        self.data["trial_number"] = trial_number
+        self.data["target_type"] = target_type
+        self.data["target_speed"] = target_speed
+        self.data["target_trajectory"] = target_trajectory
     
     def initialize_stimulus(self) -> None:
         """Initializes the stimulus"""
-        # Speed, start position, required seconds
-        speed_ang = self.data["target_speed"]
-        speed_px = Utilities.deg_to_px(speed_ang, settings["monitor"])
-        moving_distance = Utilities.deg_to_px(settings["stimuli"]["targets"]["moving_distance"], settings["monitor"])
-        self.req_sec = moving_distance / speed_px
-        if self.req_sec > settings["stimuli"]["targets"]["max_seconds"]:
-            self.req_sec = settings["stimuli"]["targets"]["max_seconds"]
-        speed = speed_px
-        if "cir" in self.data["target_trajectory"]:
-            circumference = 2 * pi * settings["monitor"]["distance"]
-            distance_per_rotation_deg = degrees(circumference) / settings["monitor"]["distance"]
-            time_per_rotation_sec = 360 / speed_ang
-            self.req_sec = time_per_rotation_sec * (360 / distance_per_rotation_deg)
-            speed = speed_ang
-        # Trajectory
-        if self.data["target_trajectory"] == "hor_right":
-            start_pos = (-moving_distance/2, 0)
-            trajectory = HorizontalTrajectory(moving_distance, "right")
-        elif self.data["target_trajectory"] == "hor_left":
-            start_pos = (moving_distance/2, 0)
-            trajectory = HorizontalTrajectory(moving_distance, "left")
-        elif self.data["target_trajectory"] == "ver_up":
-            start_pos = (0, -moving_distance/2)
-            trajectory = VerticalTrajectory(moving_distance, "up")
-        elif self.data["target_trajectory"] == "ver_down":
-            start_pos = (0, moving_distance/2)
-            trajectory = VerticalTrajectory(moving_distance, "down")
-        elif self.data["target_trajectory"] == "diag_up_right":
-            start_pos = (-moving_distance/2, -moving_distance/2)
-            trajectory = DiagonalTrajectory(moving_distance, "up_right")
-        elif self.data["target_trajectory"] == "diag_up_left":
-            start_pos = (moving_distance/2, -moving_distance/2)
-            trajectory = DiagonalTrajectory(moving_distance, "up_left")
-        elif self.data["target_trajectory"] == "diag_down_right":
-            start_pos = (-moving_distance/2, moving_distance/2)
-            trajectory = DiagonalTrajectory(moving_distance, "down_right")
-        elif self.data["target_trajectory"] == "diag_down_left":
-            start_pos = (moving_distance/2, moving_distance/2)
-            trajectory = DiagonalTrajectory(moving_distance, "down_left")
-        elif self.data["target_trajectory"] == "cir_clock":
-            start_pos = (-moving_distance/2, 0)
-            trajectory = CircularTrajectory(radius=moving_distance/2, direction="clockwise", start=0, monitor=settings["monitor"])
-        elif self.data["target_trajectory"] == "cir_counter":
-            start_pos = (moving_distance/2, 0)
-            trajectory = CircularTrajectory(radius=moving_distance/2, direction="counterclockwise", start=0, monitor=settings["monitor"])
-        # Stimulus
-        radius = settings["stimuli"]["targets"]["radius"]
-        fill_color = settings["stimuli"]["targets"]["fillColor"]
-        line_color = settings["stimuli"]["targets"]["lineColor"]
-        if self.data["target_type"] == "moving_circle":
-            self.stimulus = MovingCircle(win=self.win, 
-                                         pos=start_pos, 
-                                         speed=speed, 
-                                         trajectory=trajectory, 
-                                         radius=radius, 
-                                         fill_color=fill_color,
-                                         line_color=line_color)
-        elif self.data["target_type"] == "jumping_circle":
-            jumping_frequency = round(settings["monitor"]["refresh_rate"] / settings["stimuli"]["targets"]["jumps_per_second"]) 
-            self.stimulus = JumpingCircle(win=self.win, 
-                                          pos=start_pos, 
-                                          speed=speed, 
-                                          trajectory=trajectory, 
-                                          update_frequency=jumping_frequency,
-                                          radius=radius,
-                                          fill_color=fill_color,
-                                          line_color=line_color)
-        elif self.data["target_type"] == "back_and_forth_array":
-            jumping_frequency = round(settings["monitor"]["refresh_rate"] / settings["stimuli"]["targets"]["jumps_per_second"])
-            self.stimulus = BackAndForthArray(win=self.win,
-                                              pos=start_pos,
-                                              speed=speed,
-                                              trajectory=trajectory,
-                                              update_frequency=jumping_frequency,
-                                              radius=radius,
-                                              element_sizes=2*radius, # double the radius to make the elements the same size as the other targets
-                                              element_colors=fill_color)
-            
+        plan = get_trial_plan(self.data["target_type"], self.data["target_speed"], self.data["target_trajectory"])
+        self.req_sec = plan.req_sec
+        self.stimulus = plan.make_stimulus(self.win)
+
+    def setup_instruction_stimuli(self) -> None:
+        """Creates the text and arrow stimuli of the instruction screens"""
+        self.instruction_text = visual.TextStim(
+            self.win, 
+            text="", 
+            height=text_settings.height,
+            wrapWidth=text_settings.wrapWidth,
+            color=text_settings.color,
+            units=text_settings.units,
+            pos=tuple(text_settings.pos)
+            )
+        self.instruction_arrow = visual.ShapeStim(self.win, vertices=[(0, 0), (0, 0)], lineColor="white", lineWidth=2, closeShape=False)
+
     def draw_instruction_arrow(self, start_pos, length, trajectory, color="white", line_width=2):
-        valid_trajectories = ["hor_right", "hor_left", "ver_up", "ver_down", "diag_up_right", "diag_up_left", "diag_down_right", "diag_down_left"]
-        if trajectory not in valid_trajectories:
+        if trajectory not in TRAJECTORY_DIRECTIONS:
             raise ValueError(f"Invalid trajectory ({trajectory})")
-        tip_length = 0.3*length
+        direction_x, direction_y = TRAJECTORY_DIRECTIONS[trajectory]
+        end_pos = (start_pos[0] + direction_x*length, start_pos[1] + direction_y*length)
+        # The tip is spread perpendicular to the direction around a base behind the end of the arrow
+        # Diagonal directions are longer than unit length, so their base is moved back less
+        tip_length = (0.2 if direction_x and direction_y else 0.3)*length
         tip_width = 0.1*length
-        if trajectory == "hor_right":
-            end_pos = (start_pos[0] + length, start_pos[1])
-            tip_vertices = [(end_pos[0] - tip_length, end_pos[1] + tip_width), end_pos, (end_pos[0] - tip_length, end_pos[1] - tip_width)]
-        elif trajectory == "hor_left":
-            end_pos = (start_pos[0] - length, start_pos[1])
-            tip_vertices = [(end_pos[0] + tip_length, end_pos[1] + tip_width), end_pos, (end_pos[0] + tip_length, end_pos[1] - tip_width)]
-        elif trajectory == "ver_up":
-            end_pos = (start_pos[0], start_pos[1] + length)
-            tip_vertices = [(end_pos[0] - tip_width, end_pos[1] - tip_length), end_pos, (end_pos[0] + tip_width, end_pos[1] - tip_length)]
-        elif trajectory == "ver_down":
-            end_pos = (start_pos[0], start_pos[1] - length)
-            tip_vertices = [(end_pos[0] - tip_width, end_pos[1] + tip_length), end_pos, (end_pos[0] + tip_width, end_pos[1] + tip_length)]
-        elif trajectory == "diag_up_right":
-            end_pos = (start_pos[0] + length, start_pos[1] + length)
-            tip_vertices = [(end_pos[0] - tip_length, end_pos[1] - tip_width), end_pos, (end_pos[0] - tip_width, end_pos[1] - tip_length)]
-        elif trajectory == "diag_up_left":
-            end_pos = (start_pos[0] - length, start_pos[1] + length)
-            tip_vertices = [(end_pos[0] + tip_length, end_pos[1] - tip_width), end_pos, (end_pos[0] + tip_width, end_pos[1] - tip_length)]
-        elif trajectory == "diag_down_right":
-            end_pos = (start_pos[0] + length, start_pos[1] - length)
-            tip_vertices = [(end_pos[0] - tip_length, end_pos[1] + tip_width), end_pos, (end_pos[0] - tip_width, end_pos[1] + tip_length)]
-        elif trajectory == "diag_down_left":
-            end_pos = (start_pos[0] - length, start_pos[1] - length)
-            tip_vertices = [(end_pos[0] + tip_length, end_pos[1] + tip_width), end_pos, (end_pos[0] + tip_width, end_pos[1] + tip_length)]
+        tip_base = (end_pos[0] - tip_length*direction_x, end_pos[1] - tip_length*direction_y)
+        tip_vertices = [(tip_base[0] - tip_width*direction_y, tip_base[1] + tip_width*direction_x), 
+                        end_pos, 
+                        (tip_base[0] + tip_width*direction_y, tip_base[1] - tip_width*direction_x)]
         line_vertices = [start_pos, end_pos]
-        visual.ShapeStim(self.win, vertices=line_vertices+tip_vertices, lineColor=color, lineWidth=line_width, closeShape=False).draw()
+        self.instruction_arrow.vertices = line_vertices+tip_vertices
+        self.instruction_arrow.lineColor = color
+        self.instruction_arrow.lineWidth = line_width
+        self.instruction_arrow.draw()
     
-    def draw_instruction_text(self, movement_text: str, trajectory_text: str) -> None:
-        instruction_text = f"Fixate on the target as it {movement_text} {trajectory_text}.\n\nFixate the target, press {settings['controls']['continue']} to make the text disappear, and press {settings['controls']['continue']} again to start the trial."
-        visual.TextStim(
-            self.win, 
-            text=instruction_text, 
-            height=settings["stimuli"]["text"]["height"],
-            wrapWidth=settings["stimuli"]["text"]["wrapWidth"],
-            color=settings["stimuli"]["text"]["color"],
-            units=settings["stimuli"]["text"]["units"],
-            pos=(settings["stimuli"]["text"]["pos"][0], settings["stimuli"]["text"]["pos"][1])
-            ).draw()
+    def draw_instruction_text(self) -> None:
+        """Draws the instruction text of the current target type and trajectory"""
+        self.instruction_text.text = INSTRUCTION_TEXTS[(self.data["target_type"], self.data["target_trajectory"])]
+        self.instruction_text.draw()
         
     def get_instruction_settings(self):
         # Offset and trajectory text
         offset = 50
-        x_offset = 0
-        y_offset = 0
-        if self.data["target_trajectory"] == "hor_right":
-            trajectory_text = "horizontally to the right"
-            x_offset = offset
-        elif self.data["target_trajectory"] == "hor_left":
-            trajectory_text = "horizontally to the left"
-            x_offset = -offset
-        elif self.data["target_trajectory"] == "ver_up":
-            trajectory_text = "vertically upwards"
-            y_offset = offset
-        elif self.data["target_trajectory"] == "ver_down":
-            trajectory_text = "vertically downwards"
-            y_offset = -offset
-        elif self.data["target_trajectory"] == "diag_up_right":
-            trajectory_text = "diagonally upwards to the right"
-            x_offset = offset
-            y_offset = offset
-        elif self.data["target_trajectory"] == "diag_up_left":
-            trajectory_text = "diagonally upwards to the left"
-            x_offset = -offset
-            y_offset = offset
-        elif self.data["target_trajectory"] == "diag_down_right":
-            trajectory_text = "diagonally downwards to the right"
-            x_offset = offset
-            y_offset = -offset
-        elif self.data["target_trajectory"] == "diag_down_left":
-            trajectory_text = "diagonally downwards to the left"
-            x_offset = -offset
-            y_offset = -offset
-        elif self.data["target_trajectory"] == "cir_clock":
-            trajectory_text = "in a clockwise circle"
-        elif self.data["target_trajectory"] == "cir_counter":
-            trajectory_text = "in a counterclockwise circle"
+        direction_x, direction_y = TRAJECTORY_DIRECTIONS.get(self.data["target_trajectory"], (0, 0))
+        x_offset = direction_x*offset
+        y_offset = direction_y*offset
+        trajectory_text = TRAJECTORY_TEXTS[self.data["target_trajectory"]]
 
         # Movement text
-        if self.data["target_type"] == "moving_circle":
-            movement_text = "moves consistently"
-        elif self.data["target_type"] == "jumping_circle":
-            movement_text = "jumps"
-        elif self.data["target_type"] == "back_and_forth_array":
-            movement_text = "jumps back and forth, while moving"
+        movement_text = MOVEMENT_TEXTS[self.data["target_type"]]
         return x_offset, y_offset, trajectory_text, movement_text
     
+    @cached_property
+    def instruction_settings(self):
+        """Instruction settings of the current trial settings, computed once"""
+        return self.get_instruction_settings()
+
     def draw_instruction_target(self):
         params = {"current_time": self.time_offset, "current_frame": 0, "final_update": False}        
         self.stimulus.update(params)
@@ -256,7 +308,7 @@ class SPTrialSection(ExperimentSection):
     
     def draw_arrow_and_target(self):
         # Get instruction settings
-        x_offset, y_offset, trajectory_text, movement_text = self.get_instruction_settings()
+        x_offset, y_offset, trajectory_text, movement_text = self.instruction_settings
         
         # Draw trajectory arrow
         arrow_start_pos = (self.stimulus.pos[0] + x_offset, self.stimulus.pos[1] + y_offset)
@@ -271,21 +323,20 @@ class SPTrialSection(ExperimentSection):
     
     def check_recalibrate(self):
         ready = True
-        keys = event.waitKeys(keyList=[settings["controls"]["continue"], settings["controls"]["recalibrate"]])
-        if settings["controls"]["recalibrate"] in keys:
+        keys = event.waitKeys(keyList=[CONTINUE_KEY, settings.controls.recalibrate])
+        if settings.controls.recalibrate in keys:
             print("Recalibrating...")
-            self.win.flip()   
-            self.el_tracker.calibrate()
+            self.el_tracker.calibrate() # The calibration display clears the window itself, so no blank flip is needed first
             ready = False
         return ready
 
     def remove_direction_arrow(self):
-        event.waitKeys(keyList=[settings["controls"]["continue"]])
+        event.waitKeys(keyList=[CONTINUE_KEY])
         self.stimulus.target.draw()
         self.win.flip()
     
     def start_trial(self):
-        event.waitKeys(keyList=[settings["controls"]["continue"]])
+        event.waitKeys(keyList=[CONTINUE_KEY])
 
     def fixation_instruction(self) -> None:
         """Draws the target and asks the participant to fixate on it"""        
@@ -305,50 +356,82 @@ class SPTrialSection(ExperimentSection):
         # Start trial
         self.start_trial()
 
-    def move_target(self, extra_draws: visual.BaseVisualStim = []) -> List[list]:
-        rows = []
+    def move_target(self, extra_draws: visual.BaseVisualStim = []) -> TrialRows:
         frame = 0
+        # Values sampled per frame, the other columns keep their value during the trial
+        columns = list(self.data)
+        sample_columns = [columns.index("experiment_time"), columns.index("trial_time"), columns.index("target_x"), columns.index("target_y")]
+        # Only trial time and target position are stored per frame, the experiment time is added after the trial
+        samples = np.empty((int(self.req_sec * settings.monitor.refresh_rate) + 32, 3))
+        max_frames = len(samples)
         
         # Start EyeLink recording
         self.el_tracker.start_trial(self.data["trial_number"])
         
+        # Look up everything used per frame once
+        quit_key = settings.controls.quit
+        req_sec = self.req_sec
+        time_offset = self.time_offset
+        update_stimulus = self.stimulus.update
+        draw_list = [self.stimulus.target, *extra_draws] # Everything drawn each frame
+        params = {"current_time": 0.0, "current_frame": 0, "final_update": False} # Updated in place each frame
+        flip = self.win.flip
+        get_keys = event.getKeys
+        clear_events = event.clearEvents
+
         # Move the target
         trial_clock = core.Clock()
-        while trial_clock.getTime() < self.req_sec:
+        get_trial_time = trial_clock.getTime
+        experiment_time_offset = self.experiment_clock.getTime() - get_trial_time() # Both clocks run at the same rate
+        trial_time = get_trial_time()
+        while trial_time < req_sec:
             # Update target position
             frame += 1
-            params = {"current_time": trial_clock.getTime() + self.time_offset, "current_frame": frame, "final_update": False}           
-            target_position = self.stimulus.update(params)
-            self.stimulus.target.draw()
-            for extra_draw in extra_draws:
-                extra_draw.draw()
-            self.win.flip()
+            params["current_time"] = trial_time + time_offset
+            params["current_frame"] = frame
+            target_position = update_stimulus(params)
+            for stim in draw_list:
+                stim.draw()
+            flip()
+            trial_time = get_trial_time() # Time the frame was shown, the next frame is updated from it
 
             # Save data
-            self.data["experiment_time"] = self.experiment_clock.getTime()
-            self.data["trial_time"] = trial_clock.getTime()
-            self.data["target_x"] = target_position[0]
-            self.data["target_y"] = target_position[1]
-            rows.append([value for value in self.data.values()])
+            if frame > max_frames: # The monitor runs faster than its refresh rate setting
+                samples = np.concatenate((samples, np.empty_like(samples)))
+                max_frames = len(samples)
+            samples[frame - 1] = (trial_time, target_position[0], target_position[1])
     
-            # Check cancelation
-            if settings["controls"]["quit"] in event.getKeys():
-                self.el_tracker.end_session()
-            event.clearEvents()
+            # Check cancelation every few frames, a key press stays in the event buffer until then
+            if frame % KEY_POLL_FRAMES == 0:
+                if get_keys(keyList=[quit_key]):
+                    self.el_tracker.end_session()
+                clear_events()
+
+        # Check cancelation once more, a key pressed after the last check would be cleared by the next waitKeys
+        if get_keys(keyList=[quit_key]):
+            self.el_tracker.end_session()
 
         # One final update to end jumping stimuli at the final position
-        params = {"current_time": trial_clock.getTime() + self.time_offset, "current_frame": frame, "final_update": True}           
+        params["current_time"] = trial_clock.getTime() + self.time_offset
+        params["final_update"] = True
         target_position = self.stimulus.update(params)
         self.stimulus.target.draw()
+        # Stop EyeLink recording on the final flip, the tracker delay overlaps the final fixation
+        hold_clock = core.Clock()
+        self.win.callOnFlip(hold_clock.reset)
+        self.win.callOnFlip(self.el_tracker.end_trial, self.data["trial_number"])
         self.win.flip()
-        core.wait(0.2) # wait 200ms on final fixation
-        # Stop EyeLink recording
-        self.el_tracker.end_trial(self.data["trial_number"])
-        return rows
+        core.wait(max(0.0, 0.2 - hold_clock.getTime())) # wait 200ms on final fixation
+        samples = samples[:frame]
+        samples = np.column_stack((samples[:, 0] + experiment_time_offset, samples))
+        return TrialRows(list(self.data.values()), sample_columns, samples)
 
     def run(self):
         # Initialize stimulus
-        self.initialize_stimulus()
+        if self.stimulus is None:
+            self.initialize_stimulus()
+        if self.instruction_text is None:
+            self.setup_instruction_stimuli()
         
         # Show instructions
         self.fixation_instruction()
@@ -371,6 +454,20 @@ class SPTrialTutorial(SPTrialSection):
                 time_offset: int = 0) -> None:
         super().__init__(name, data, experiment_clock, win, el_tracker, trial_number, target_type, target_speed, target_trajectory, time_offset)
         self.data["target_speed"] = 2
+        self.tutorial_text = None
+
+    def setup_instruction_stimuli(self) -> None:
+        """Creates the instruction stimuli and the text of the tutorial steps"""
+        super().setup_instruction_stimuli()
+        self.tutorial_text = visual.TextStim(
+            self.win,
+            text="",
+            height=0.05,
+            wrapWidth=0.5,
+            color=text_settings.color,
+            units="norm",
+            pos=(0, 0.5)
+            )
     
     def tutorial_step_1(self):
         """Draw target"""
@@ -378,21 +475,14 @@ class SPTrialTutorial(SPTrialSection):
         self.draw_instruction_target()
 
         # Draw step 1 instruction text
-        visual.TextStim(
-            self.win, 
-            text=settings["experiment"]["tutorial"]["step_1"], 
-            height=0.05,
-            wrapWidth=0.5,
-            color=settings["stimuli"]["text"]["color"],
-            units="norm",
-            pos=(0, 0.5)
-            ).draw()
+        self.tutorial_text.text = settings.experiment.tutorial.step_1
+        self.tutorial_text.draw()
         
         # Flip window
         self.win.flip()
 
         # Wait for continue key
-        event.waitKeys(keyList=[settings["controls"]["continue"]])
+        event.waitKeys(keyList=[CONTINUE_KEY])
 
     def tutorial_step_2(self):
         """Draw arrow"""
@@ -400,28 +490,21 @@ class SPTrialTutorial(SPTrialSection):
         self.draw_instruction_target()
 
         # Get instruction settings
-        x_offset, y_offset, trajectory_text, movement_text = self.get_instruction_settings()
+        x_offset, y_offset, trajectory_text, movement_text = self.instruction_settings
 
         # Draw arrow
         arrow_start_pos = (self.stimulus.pos[0] + x_offset, self.stimulus.pos[1] + y_offset)
         self.draw_instruction_arrow(start_pos=arrow_start_pos, length=100, trajectory=self.data["target_trajectory"], line_width=5)
        
        # Draw step 2 instruction text
-        visual.TextStim(
-            self.win,
-            text=settings["experiment"]["tutorial"]["step_2"],
-            height=0.05,
-            wrapWidth=0.5,
-            color=settings["stimuli"]["text"]["color"],
-            units="norm",
-            pos=(0, 0.5)
-            ).draw()
+        self.tutorial_text.text = settings.experiment.tutorial.step_2
+        self.tutorial_text.draw()
         
         # Flip window
         self.win.flip()
 
         # Wait for continue key
-        event.waitKeys(keyList=[settings["controls"]["continue"]])
+        event.waitKeys(keyList=[CONTINUE_KEY])
 
     def tutorial_step_3(self):
         """Remove arrow"""
@@ -429,22 +512,15 @@ class SPTrialTutorial(SPTrialSection):
         self.draw_instruction_target()
 
         # Get instruction settings
-        x_offset, y_offset, trajectory_text, movement_text = self.get_instruction_settings()
+        x_offset, y_offset, trajectory_text, movement_text = self.instruction_settings
 
         # Draw arrow
         arrow_start_pos = (self.stimulus.pos[0] + x_offset, self.stimulus.pos[1] + y_offset)
         self.draw_instruction_arrow(start_pos=arrow_start_pos, length=100, trajectory=self.data["target_trajectory"], line_width=5)
 
         # Draw step 3 instruction text
-        visual.TextStim(
-            self.win,
-            text=settings["experiment"]["tutorial"]["step_3"],
-            height=0.05,
-            wrapWidth=0.5,
-            color=settings["stimuli"]["text"]["color"],
-            units="norm",
-            pos=(0, 0.5)
-            ).draw()
+        self.tutorial_text.text = settings.experiment.tutorial.step_3
+        self.tutorial_text.draw()
         
         # Flip window
         self.win.flip()
@@ -458,15 +534,8 @@ class SPTrialTutorial(SPTrialSection):
         self.draw_instruction_target()
 
         # Draw step 4 instruction text
-        visual.TextStim(
-            self.win,
-            text=settings["experiment"]["tutorial"]["step_4"],
-            height=0.05,
-            wrapWidth=0.5,
-            color=settings["stimuli"]["text"]["color"],
-            units="norm",
-            pos=(0, 0.5)
-            ).draw()
+        self.tutorial_text.text = settings.experiment.tutorial.step_4
+        self.tutorial_text.draw()
         
         # Flip window
         self.win.flip()
@@ -476,17 +545,8 @@ class SPTrialTutorial(SPTrialSection):
 
     def tutorial_step_5(self):
         # Draw step 5 instruction text
-        rows = self.move_target(extra_draws=[
-            visual.TextStim(
-            self.win,
-            text=settings["experiment"]["tutorial"]["step_5"],
-            height=0.05,
-            wrapWidth=0.5,
-            color=settings["stimuli"]["text"]["color"],
-            units="norm",
-            pos=(0, 0.5)
-            )
-        ])  
+        self.tutorial_text.text = settings.experiment.tutorial.step_5
+        rows = self.move_target(extra_draws=[self.tutorial_text])
         return rows
     
     def tutorial_step_6(self):        
@@ -494,31 +554,27 @@ class SPTrialTutorial(SPTrialSection):
         self.draw_instruction_target()
 
         # Get instruction settings
-        x_offset, y_offset, trajectory_text, movement_text = self.get_instruction_settings()
+        x_offset, y_offset, trajectory_text, movement_text = self.instruction_settings
 
         # Draw arrow
         arrow_start_pos = (self.stimulus.pos[0] + x_offset, self.stimulus.pos[1] + y_offset)
         self.draw_instruction_arrow(start_pos=arrow_start_pos, length=100, trajectory=self.data["target_trajectory"], line_width=5)
 
         # Draw step 6 instruction text
-        visual.TextStim(
-            self.win,
-            text=settings["experiment"]["tutorial"]["step_6"],
-            height=settings["stimuli"]["text"]["height"],
-            wrapWidth=settings["stimuli"]["text"]["wrapWidth"],
-            color=settings["stimuli"]["text"]["color"],
-            units=settings["stimuli"]["text"]["units"],
-            pos=settings["stimuli"]["text"]["pos"]
-            ).draw()
+        self.instruction_text.text = settings.experiment.tutorial.step_6
+        self.instruction_text.draw()
 
         # Flip window
         self.win.flip()
 
         # Wait for continue key
-        event.waitKeys(keyList=[settings["controls"]["continue"]])
+        event.waitKeys(keyList=[CONTINUE_KEY])
 
     def run(self):
-        self.initialize_stimulus()
+        if self.stimulus is None:
+            self.initialize_stimulus()
+        if self.instruction_text is None:
+            self.setup_instruction_stimuli()
         self.tutorial_step_1()
         self.tutorial_step_2()
         self.tutorial_step_3()
@@ -12,6 +12,7 @@ from classes.utilities.EyeLinkCoreGraphicsPsychoPy import EyeLinkCoreGraphicsPsy
 class EyeTracker():
     def __init__(self, win: visual.Window, filename: str, data_path: str, dummy_mode=False):
         self.win = win
+        self.scn_width, self.scn_height = win.size # The window size does not change during a session
         self.filename = filename
         self.data_path = data_path
         self.dummy_mode = dummy_mode
@@ -41,6 +42,8 @@ class EyeTracker():
             sys.exit()
     
     def configure_eyetracker(self) -> None:
+        calibration_settings = settings.tracker.calibration
+
         # offline mode before changing parameters
         self.el_tracker.setOfflineMode()
 
@@ -63,39 +66,43 @@ class EyeTracker():
             file_sample_flags = 'LEFT,RIGHT,GAZE,HREF,RAW,AREA,GAZERES,BUTTON,STATUS,INPUT'
             link_sample_flags = 'LEFT,RIGHT,GAZE,GAZERES,AREA,STATUS,INPUT'
 
-        # Send commands
-        self.el_tracker.sendCommand("file_event_filter = %s" % file_event_flags)
-        self.el_tracker.sendCommand("file_sample_data = %s" % file_sample_flags)
-        self.el_tracker.sendCommand("link_event_filter = %s" % link_event_flags)
-        self.el_tracker.sendCommand("link_sample_data = %s" % link_sample_flags)
+        # Commands
+        commands = ["file_event_filter = %s" % file_event_flags,
+                    "file_sample_data = %s" % file_sample_flags,
+                    "link_event_filter = %s" % link_event_flags,
+                    "link_sample_data = %s" % link_sample_flags]
 
         # Sampling Rate to 1000hz
         if eyelink_ver > 2:
-            self.el_tracker.sendCommand("sample_rate 1000")
+            commands.append("sample_rate 1000")
         
         # Calibration type 
-        self.el_tracker.sendCommand(f'calibration_type = {settings["tracker"]["calibration"]["calibration_type"]}')
+        commands.append(f'calibration_type = {calibration_settings.calibration_type}')
+
+        # Send commands back to back, sendCommand does not wait for the tracker to reply
+        send_command = self.el_tracker.sendCommand
+        for command in commands:
+            send_command(command)
     
     def prepare_calibration(self) -> None:
        """Sets up the graphics for calibration"""
-       # Get screen resolution
-       scn_width, scn_height = self.win.size
        # Pass pixel coordinates to tracker
-       el_coords = "screen_pixel_coords = 0 0 %d %d" % (scn_width - 1, scn_height - 1)
+       el_coords = "screen_pixel_coords = 0 0 %d %d" % (self.scn_width - 1, self.scn_height - 1)
        self.el_tracker.sendCommand(el_coords)
        # Add pixel coordinates to EDF file
-       dv_coords = "DISPLAY_COORDS  0 0 %d %d" % (scn_width - 1, scn_height - 1)
+       dv_coords = "DISPLAY_COORDS  0 0 %d %d" % (self.scn_width - 1, self.scn_height - 1)
        self.el_tracker.sendMessage(dv_coords)
 
        # Configure a graphics environment for calibration
        genv = EyeLinkCoreGraphicsPsychoPy(self.el_tracker, self.win)
        
        # Set calibration targets
-       target_color = settings["tracker"]["calibration"]["target_color"]
+       calibration_settings = settings.tracker.calibration
+       target_color = calibration_settings.target_color
        background_color = self.win.color
        genv.setCalibrationColors(target_color, background_color)
-       genv.setTargetType(settings["tracker"]["calibration"]["target_type"])
-       genv.setTargetSize(settings["tracker"]["calibration"]["target_size"])
+       genv.setTargetType(calibration_settings.target_type)
+       genv.setTargetSize(calibration_settings.target_size)
        genv.setCalibrationSounds('off', 'off', 'off')
 
        # Tell pylink to use this graphics environment for calibration
@@ -142,7 +149,8 @@ class EyeTracker():
             print("ERROR:", error)
             self.abort_trial()
             print(pylink.TRIAL_ERROR)
-        pylink.pumpDelay(100)
+        # Wait until samples arrive over the link instead of a fixed 100 ms, waiting at most 100 ms
+        self.el_tracker.waitForBlockStart(100, 1, 0)
 
         # Onset message
         self.el_tracker.sendMessage(f'{trial_number}: TARGET_ONSET')
@@ -156,13 +164,23 @@ class EyeTracker():
         # End trial message
         self.el_tracker.sendMessage(f'{trial_number}: TRIAL_RESULT {pylink.TRIAL_OK}')
 
+    def receive_edf_file(self) -> None:
+        """Downloads the EDF data file from the Host PC to the local data folder"""
+        host_edf = f"{self.filename}.EDF"
+        local_edf = f"{self.data_path}/{self.filename}.EDF"
+        try:
+            self.el_tracker.receiveDataFile(host_edf, local_edf)
+        except RuntimeError as error:
+            print('ERROR:', error)
+
     def end_session(self) -> None:
         """ Terminate the task gracefully and retrieve the EDF data file
 
         file_to_retrieve: The EDF on the Host that we would like to download
         win: the current window used by the experimental script
         """
-        if self.el_tracker.isConnected():
+        link_connected = self.el_tracker.isConnected()
+        if link_connected:
             # Terminate the current trial first if the task terminated prematurely
             error = self.el_tracker.isRecording()
             if error == pylink.TRIAL_OK:
@@ -178,20 +196,16 @@ class EyeTracker():
             # Close the edf data file on the Host
             self.el_tracker.closeDataFile()
 
-            # Download the EDF data file from the Host PC to a local data folder
-            host_edf = f"{self.filename}.EDF"
-            local_edf = f"{self.data_path}/{self.filename}.EDF"
-            try:
-                self.el_tracker.receiveDataFile(host_edf, local_edf)
-            except RuntimeError as error:
-                print('ERROR:', error)
+        # close the PsychoPy window first, so the participant does not see a frozen screen during the download
+        self.win.close()
 
+        if link_connected:
+            # Download the EDF data file on this thread, the link is not thread-safe
+            print("Saving the EDF file...")
+            self.receive_edf_file()
             # Close the link to the tracker.
             self.el_tracker.close()
 
-        # close the PsychoPy window
-        self.win.close()
-
         # quit PsychoPy
         core.quit()
         sys.exit()
@@ -1,5 +1,6 @@
 # Stimuli are targets shown on a psychopy window and that are updated every frame
 from math import cos, sin, radians, degrees, atan2, pi
+import numpy as np
 from numpy.random import choice
 from psychopy import visual
 from typing import Tuple, List
@@ -11,13 +12,13 @@ class Stimulus:
     def __init__(self, 
                  win: visual.Window, 
                  pos: Tuple[float, float]) -> None:
-        if not isinstance(win, visual.Window):
+        if __debug__ and not isinstance(win, visual.Window):
             raise ValueError("window must be an instance of psychopy.visual.Window")
-        if not isinstance(pos, tuple):
+        if __debug__ and not isinstance(pos, tuple):
             raise ValueError("pos must be a tuple")
-        if not len(pos) == 2:
+        if __debug__ and not len(pos) == 2:
             raise ValueError("pos must be a tuple of length 2")
-        if not isinstance(pos[0], int) and not isinstance(pos[0], float) and not isinstance(pos[1], int) and not isinstance(pos[1], float):
+        if __debug__ and not isinstance(pos[0], (int, float)) and not isinstance(pos[1], (int, float)):
             raise ValueError("pos[0] must be an int or a float")
         self.window = win
         self.pos = pos
@@ -25,8 +26,6 @@ class Stimulus:
     def update(self, params: dict) -> Tuple[float]:
         """Overwritten by subclasses with moving stimuli.
         Must return self.target.pos"""
-        if not isinstance(params, dict):
-            raise ValueError("params must be a dict")
         pass
 
 
@@ -39,7 +38,7 @@ class CircleStimulus(Stimulus):
                  fill_color = "white", 
                  line_color = "white") -> None:
         super().__init__(win, pos)
-        if not isinstance(radius, int) and not isinstance(radius, float):
+        if __debug__ and not isinstance(radius, (int, float)):
             raise ValueError("radius must be an int or float")
         self.target = visual.Circle(self.window, radius = radius, fillColor = fill_color, lineColor = line_color, pos = self.pos)
 
@@ -55,16 +54,15 @@ class MovingCircle(CircleStimulus):
                  speed = 1, 
                  trajectory: Trajectory = None) -> None:
         super().__init__(win, pos, radius, fill_color, line_color)
-        if not isinstance(speed, float) and not isinstance(speed, int):
+        if __debug__ and not isinstance(speed, (int, float)):
             raise ValueError("speed must be a int or float")
-        if not isinstance(trajectory, Trajectory):
+        if __debug__ and not isinstance(trajectory, Trajectory):
             raise ValueError("trajectory must be an instance of Trajectory")
         self.speed = speed
         self.trajectory = trajectory
 
     def update(self, params: dict) -> None:
         """Updates the position of the stimulus"""
-        super().update(params)
         current_time = params["current_time"]
         self.target.pos = self.trajectory.update_position(self.target.pos, current_time, self.speed)
         self.target.ori = self.trajectory.update_orientation(self.target.pos, current_time, self.speed)
@@ -84,14 +82,22 @@ class JumpingCircle(MovingCircle):
                  update_frequency = None) -> None: # defines how many frames the position of the circle should be updated, None means never
         super().__init__(win, pos, radius, fill_color, line_color, speed, trajectory)
         self.update_frequency = update_frequency
+        self.frames_left = update_frequency # Frames until the next jump
     
     def update(self, params: dict) -> None:
         """Updates the position of the stimulus"""
         if not self.update_frequency is None:
             current_frame = params["current_frame"]
-            final_update = params["final_update"]
-            if current_frame % self.update_frequency == 0 or current_frame == 1 or final_update:
+            if current_frame <= 1: # Instruction and first trial frame, start counting down again
+                self.frames_left = self.update_frequency - 1
+                super().update(params)
+            elif params["final_update"]:
                 super().update(params)
+            else:
+                self.frames_left -= 1
+                if self.frames_left <= 0:
+                    self.frames_left = self.update_frequency
+                    super().update(params)
         return self.target.pos
 
 
@@ -104,15 +110,15 @@ class LineStimulus(Stimulus):
                  line_width = 1, 
                  line_color = "white") -> None:
         super().__init__(win)
-        if not isinstance(start, tuple) or not isinstance(end, tuple):
+        if __debug__ and not (isinstance(start, tuple) and isinstance(end, tuple)):
             raise ValueError("start and end must be tuples")
-        if not len(start) == 2 or not len(end) == 2:
+        if __debug__ and (not len(start) == 2 or not len(end) == 2):
             raise ValueError("start and end must be tuples of length 2")
-        if not isinstance(start[0], int) and not isinstance(start[0], float) and not isinstance(start[1], int) and not isinstance(start[1], float):
+        if __debug__ and not isinstance(start[0], (int, float)) and not isinstance(start[1], (int, float)):
             raise ValueError("start[0] and start[1] must be ints or floats")
-        if not isinstance(end[0], int) and not isinstance(end[0], float) and not isinstance(end[1], int) and not isinstance(end[1], float):
+        if __debug__ and not isinstance(end[0], (int, float)) and not isinstance(end[1], (int, float)):
             raise ValueError("end[0] and end[1] must be ints or floats")
-        if not isinstance(line_width, int) and not isinstance(line_width, float):
+        if __debug__ and not isinstance(line_width, (int, float)):
             raise ValueError("width must be an int or float")
         self.target = visual.Line(self.window, start = start, end = end, lineWidth = line_width, lineColor = line_color)
 
@@ -156,52 +162,51 @@ class BackAndForthArray(ArrayStimulus):
                          element_colors=element_colors, 
                          element_sizes=element_sizes, 
                          element_xys=[(0, 0)])
-        if not isinstance(speed, float) and not isinstance(speed, int):
+        if __debug__ and not isinstance(speed, (int, float)):
             raise ValueError("speed must be a int or float")
-        if not isinstance(trajectory, Trajectory):
+        if __debug__ and not isinstance(trajectory, Trajectory):
             raise ValueError("trajectory must be an instance of Trajectory")
         self.speed = speed
         self.trajectory = trajectory
         self.update_frequency = update_frequency
+        self.frames_left = update_frequency # Frames until the target switches between back and forth
         self.back = True
+        # Resolve the back and forth positions once, only the circular tangent changes with the position
+        self.field_width, self.field_height = self.target.fieldSize
+        if isinstance(trajectory, CircularTrajectory):
+            self.get_back_and_forth = self.get_tangent_back_and_forth
+        else:
+            back_and_forth = self.get_linear_back_and_forth()
+            self.get_back_and_forth = lambda: back_and_forth
 
-    def update_xys(self) -> None:
-        """Updates the position of the target in the array to match the current movement vector"""
+    def get_linear_back_and_forth(self) -> Tuple[List[Tuple[float, float]], List[Tuple[float, float]]]:
+        """Returns the back and forth positions of the target in the array along a linear trajectory"""
+        width, height = self.field_width, self.field_height
         if isinstance(self.trajectory, HorizontalTrajectory):
-            back = [(-self.target.fieldSize[0], 0)]
-            forth = [(self.target.fieldSize[0], 0)]
-        elif isinstance(self.trajectory, VerticalTrajectory):
-            back = [(0, -self.target.fieldSize[1])]
-            forth = [(0, self.target.fieldSize[1])]
-        elif isinstance(self.trajectory, DiagonalTrajectory):
-            if self.trajectory.direction == "up_right":
-                back = [(-self.target.fieldSize[0], -self.target.fieldSize[1])]
-                forth = [(self.target.fieldSize[0], self.target.fieldSize[1])]
-            elif self.trajectory.direction == "up_left":
-                back = [(self.target.fieldSize[0], -self.target.fieldSize[1])]
-                forth = [(-self.target.fieldSize[0], self.target.fieldSize[1])]
-            elif self.trajectory.direction == "down_right":
-                back = [(-self.target.fieldSize[0], self.target.fieldSize[1])]
-                forth = [(self.target.fieldSize[0], -self.target.fieldSize[1])]
-            elif self.trajectory.direction == "down_left":
-                back = [(self.target.fieldSize[0], self.target.fieldSize[1])]
-                forth = [(-self.target.fieldSize[0], -self.target.fieldSize[1])]
-        
-        elif isinstance(self.trajectory, CircularTrajectory):
-            # tangent along the current point on the radius of the circle with center (0,0)
-            current_pos = self.target.fieldPos
-            center = (0,0)
-            # calculate degrees from x and y
-            deg = degrees(atan2(current_pos[1] - center[1], current_pos[0] - center[0]))
+            return [(-width, 0)], [(width, 0)]
+        if isinstance(self.trajectory, VerticalTrajectory):
+            return [(0, -height)], [(0, height)]
+        if isinstance(self.trajectory, DiagonalTrajectory) and self.trajectory.direction in ("up_right", "up_left", "down_right", "down_left"):
+            x = width if self.trajectory.direction.endswith("right") else -width
+            y = height if self.trajectory.direction.startswith("up") else -height
+            return [(-x, -y)], [(x, y)]
+        raise ValueError("trajectory must be a horizontal, vertical, diagonal, or circular trajectory")
+
+    def get_tangent_back_and_forth(self, _cos=cos, _sin=sin, _radians=radians, _degrees=degrees, _atan2=atan2) -> Tuple[List[Tuple[float, float]], List[Tuple[float, float]]]:
+        """Returns the back and forth positions of the target in the array along the tangent of a circular trajectory"""
+        # tangent along the current point on the radius of the circle with center (0,0)
+        current_pos = self.target.fieldPos
+        # calculate the tangent angle from x and y
+        tangent_angle = _radians(_degrees(_atan2(current_pos[1], current_pos[0])) + 90)
 
-            # Calculate the coordinates of the tangent line endpoints
-            tangent_angle = deg + 90
-            tangent_start_x = -self.target.fieldSize[0] * cos(radians(tangent_angle))
-            tangent_start_y = -self.target.fieldSize[1] * sin(radians(tangent_angle))
-            tangent_end_x = self.target.fieldSize[0] * cos(radians(tangent_angle))
-            tangent_end_y = -self.target.fieldSize[1] * sin(radians(tangent_angle))
-            back = [(tangent_start_x, tangent_start_y)]
-            forth = [(tangent_end_x, tangent_end_y)]
+        # Calculate the coordinates of the tangent line endpoints
+        tangent_x = self.field_width * _cos(tangent_angle)
+        tangent_y = -self.field_height * _sin(tangent_angle)
+        return [(-tangent_x, tangent_y)], [(tangent_x, tangent_y)]
+
+    def update_xys(self) -> None:
+        """Updates the position of the target in the array to match the current movement vector"""
+        back, forth = self.get_back_and_forth()
         if self.back:
             self.target.xys = back
             self.back = False
@@ -211,13 +216,21 @@ class BackAndForthArray(ArrayStimulus):
 
     def update(self, params: dict) -> None:
         """Updates the position of the stimulus"""
-        super().update(params)
         current_time = params["current_time"]
         self.target.fieldPos = self.trajectory.update_position(self.target.fieldPos, current_time, self.speed)
         if not self.update_frequency is None:
             current_frame = params["current_frame"]
-            if current_frame % self.update_frequency == 0 or current_frame == 1:
+            if current_frame <= 1: # Instruction and first trial frame, start counting down again
+                self.frames_left = self.update_frequency - 1
                 self.update_xys()
+            elif params["final_update"]: # Not a new frame, switches again if the last frame switched
+                if self.frames_left == self.update_frequency:
+                    self.update_xys()
+            else:
+                self.frames_left -= 1
+                if self.frames_left <= 0:
+                    self.frames_left = self.update_frequency
+                    self.update_xys()
         x = self.target.fieldPos[0] - self.target.xys[0][0] 
         y = self.target.fieldPos[1] - self.target.xys[0][1] 
         return (x, y)
@@ -235,45 +248,49 @@ class SwarmStimulus(Stimulus):
                  element_colors = "white",
                  update_frequency = None) -> None: # defines how many frames the position of active elements should be updated, None means never
         super().__init__(win, pos)
-        if not isinstance(radius, int) and not isinstance(radius, float):
+        if __debug__ and not isinstance(radius, (int, float)):
             raise ValueError("radius must be an int or float")
-        if not isinstance(n_elements, int):
+        if __debug__ and not isinstance(n_elements, int):
             raise ValueError("n must be an int")
-        if not isinstance(n_active, int):
+        if __debug__ and not isinstance(n_active, int):
             raise ValueError("n_active must be an int")
-        if not isinstance(element_sizes, int) and not isinstance(element_sizes, float) and not isinstance(element_sizes, list):
+        if __debug__ and not isinstance(element_sizes, (int, float, list)):
             raise ValueError("element_sizes must be an int, float, or list of length n_elements of ints or floats")
-        if isinstance(element_sizes, list) and not len(element_sizes) == n_elements:
+        if __debug__ and isinstance(element_sizes, list) and not len(element_sizes) == n_elements:
             raise ValueError("element_sizes must be a list of length n_elements")
-        if isinstance(element_sizes, list) and not all([isinstance(x, int) or isinstance(x, float) for x in element_sizes]):
+        if __debug__ and isinstance(element_sizes, list) and not all([isinstance(x, (int, float)) for x in element_sizes]):
             raise ValueError("element_sizes must be a list of ints or floats")
-        if not isinstance(element_colors, str) and not isinstance(element_colors, list):
+        if __debug__ and not isinstance(element_colors, (str, list)):
             raise ValueError("element_colors must be a string or a list of length n_elements of strings")
-        if isinstance(element_colors, list) and not len(element_colors) == n_elements:
+        if __debug__ and isinstance(element_colors, list) and not len(element_colors) == n_elements:
             raise ValueError("element_colors must be a list of length n_elements")
-        if isinstance(element_colors, list) and not all([isinstance(x, str) for x in element_colors]):
+        if __debug__ and isinstance(element_colors, list) and not all([isinstance(x, str) for x in element_colors]):
             raise ValueError("element_colors must be a list of strings")
-        if not isinstance(update_frequency, int) and not update_frequency is None:
+        if __debug__ and not isinstance(update_frequency, int) and not update_frequency is None:
             raise ValueError("update_frequency must be an int")
         self.n = n_elements
         self.n_active = n_active
         self.update_frequency = update_frequency
+        self.frames_left = update_frequency # Frames until the active elements change
         self.target = visual.ElementArrayStim(self.window, nElements = self.n, fieldPos = pos, fieldSize = radius*2, fieldShape = "circle", sizes = element_sizes, colors = element_colors, elementMask = "circle", elementTex = None)
-        self.target.opacities = 0
-        for i in range(self.n_active): # turn on n_active elements
-            j = choice(range(self.n), replace = False)
-            self.target.opacities[j] = 1
+        self.opacities = np.zeros(self.n) # Reused opacity buffer, only the active elements are changed
+        self.active = choice(self.n, size = self.n_active, replace = False) # n_active distinct elements
+        self.opacities[self.active] = 1
+        self.target.opacities = self.opacities
         
     def update(self, params: dict) -> None:
         """Updates the position of the active elements"""
-        super().update(params)
         if not self.update_frequency is None:
-            current_frame = params["current_frame"]
-            if current_frame % self.update_frequency == 0:
-                self.target.opacities = 0
-                for i in range(self.n_active):
-                    j = choice(range(self.n), replace = False)
-                    self.target.opacities[j] = 1
+            if params["current_frame"] == 0: # Start counting down again
+                self.frames_left = 0
+            else:
+                self.frames_left -= 1
+            if self.frames_left <= 0:
+                self.frames_left = self.update_frequency
+                self.opacities[self.active] = 0
+                self.active = choice(self.n, size = self.n_active, replace = False)
+                self.opacities[self.active] = 1
+                self.target.opacities = self.opacities # Assigned through the setter so psychopy updates the colors
 
 
 class MovingSwarm(SwarmStimulus):
@@ -289,9 +306,9 @@ class MovingSwarm(SwarmStimulus):
                  speed = 1, 
                  trajectory: Trajectory = None) -> None:
         super().__init__(win, pos, radius, n_elements, n_active, element_sizes, element_colors, update_frequency)
-        if not isinstance(speed, float) and not isinstance(speed, int):
+        if __debug__ and not isinstance(speed, (int, float)):
             raise ValueError("speed must be a int or float")
-        if not isinstance(trajectory, Trajectory):
+        if __debug__ and not isinstance(trajectory, Trajectory):
             raise ValueError("trajectory must be an instance of Trajectory")
         self.speed = speed
         self.trajectory = trajectory
@@ -1,108 +1,127 @@
 # Trajectories are mathematical functions that describe how a target moves accross the screen
 # They can update the target position according to their function, the current target position, the speed of the target, and the time step
+import numpy as np
+from types import SimpleNamespace
 from typing import Tuple
-from math import cos, sin, radians, degrees, atan2, pi
+from math import cos, sin, radians, degrees, atan2
 from classes.utilities.utilities import Utilities
 
 class Trajectory:
-    def update_position(self, current_position: Tuple[float, float], time_step: float, speed: float) -> Tuple[float, float]:
+    def __init__(self) -> None:
+        self.position = np.empty(2) # Reused for every returned position, copy it to keep a position
+
+    def update_position(self, current_position: Tuple[float, float], time_step: float, speed: float) -> np.ndarray:
         """This method should be overridden by subclasses"""
         raise NotImplementedError
     
     def update_orientation(self, current_position: Tuple[float, float], time_step, speed) -> float:
         """Updates the orientation to always point in the direction of the current movement vector"""
         next_position = self.update_position(current_position, time_step, speed)
-        return degrees(-1 * radians((180 / pi) * (atan2(next_position[1] - current_position[1], next_position[0] - current_position[0]))))
+        return -degrees(atan2(next_position[1] - current_position[1], next_position[0] - current_position[0]))
 
 class HorizontalTrajectory(Trajectory):
     def __init__(self, distance_px: float, direction = "left") -> None:
         super().__init__()
-        if not isinstance(distance_px, float) and not isinstance(distance_px, int):
+        if __debug__ and not isinstance(distance_px, (int, float)):
             raise ValueError("distance_px must be a int or float")
-        if direction not in ["left", "right"]:
+        if __debug__ and direction not in ["left", "right"]:
             raise ValueError("direction must be 'left' or 'right'")
         self.distance_px_halfed = distance_px/2
         self.direction = direction
+        # x = sign_x * speed * time + offset_x
+        self.sign_x = -1.0 if direction == "left" else 1.0
+        self.offset_x = self.distance_px_halfed if direction == "left" else -self.distance_px_halfed
         
-    def update_position(self, current_position: Tuple[float, float], time_step: float, speed: float) -> Tuple[float, float]:
-        if self.direction == "left":
-            return ((-speed * time_step) + self.distance_px_halfed, current_position[1])
-        else:
-            return (speed * time_step - self.distance_px_halfed , current_position[1])
+    def update_position(self, current_position: Tuple[float, float], time_step: float, speed: float) -> np.ndarray:
+        position = self.position
+        position[1] = current_position[1]
+        position[0] = self.sign_x * speed * time_step + self.offset_x
+        return position
 
 class VerticalTrajectory(Trajectory):
     def __init__(self, distance_px: float, direction = "up") -> None:
         super().__init__()
-        if not isinstance(distance_px, float) and not isinstance(distance_px, int):
+        if __debug__ and not isinstance(distance_px, (int, float)):
             raise ValueError("distance_px must be a int or float")
-        if direction not in ["up", "down"]:
+        if __debug__ and direction not in ["up", "down"]:
             raise ValueError("direction must be 'up' or 'down'")
         self.distance_px_halfed = distance_px/2
         self.direction = direction
+        # y = sign_y * speed * time + offset_y
+        self.sign_y = 1.0 if direction == "up" else -1.0
+        self.offset_y = -self.distance_px_halfed if direction == "up" else self.distance_px_halfed
         
-    def update_position(self, current_position: Tuple[float, float], time_step: float, speed: float) -> Tuple[float, float]:
-        if self.direction == "up":
-            return (current_position[0], (speed * time_step) - self.distance_px_halfed)
-        else:
-            return (current_position[0], (-speed * time_step) + self.distance_px_halfed)
+    def update_position(self, current_position: Tuple[float, float], time_step: float, speed: float) -> np.ndarray:
+        position = self.position
+        position[0] = current_position[0]
+        position[1] = self.sign_y * speed * time_step + self.offset_y
+        return position
 
 class DiagonalTrajectory(Trajectory):
     def __init__(self, distance_px: float, direction = "up_right") -> None:
         super().__init__()
-        if not isinstance(distance_px, float) and not isinstance(distance_px, int):
+        if __debug__ and not isinstance(distance_px, (int, float)):
             raise ValueError("distance_px must be a int or float")
-        if direction not in ["up_right", "up_left", "down_right", "down_left"]:
+        if __debug__ and direction not in ["up_right", "up_left", "down_right", "down_left"]:
             raise ValueError("direction must be 'up_right', 'up_left', 'down_right', or 'down_left'")
         self.distance_px_halfed = distance_px/2
         self.direction = direction
+        # x = sign_x * speed * time + offset_x, y = sign_y * speed * time + offset_y
+        self.sign_x = 1.0 if direction.endswith("right") else -1.0
+        self.sign_y = 1.0 if direction.startswith("up") else -1.0
+        self.offset_x = -self.sign_x * self.distance_px_halfed
+        self.offset_y = -self.sign_y * self.distance_px_halfed
         
-    def update_position(self, current_position: Tuple[float, float], time_step: float, speed: float) -> Tuple[float, float]:
-        if self.direction == "up_right":
-            return ((speed * time_step) - self.distance_px_halfed, (speed * time_step) - self.distance_px_halfed)
-        elif self.direction == "up_left":
-            return ((-speed * time_step) + self.distance_px_halfed, (speed * time_step) - self.distance_px_halfed)
-        elif self.direction == "down_right":
-            return ((speed * time_step) - self.distance_px_halfed, (-speed * time_step) + self.distance_px_halfed)
-        else:
-            return ((-speed * time_step) + self.distance_px_halfed, (-speed * time_step) + self.distance_px_halfed)
+    def update_position(self, current_position: Tuple[float, float], time_step: float, speed: float) -> np.ndarray:
+        distance = speed * time_step
+        position = self.position
+        position[0] = self.sign_x * distance + self.offset_x
+        position[1] = self.sign_y * distance + self.offset_y
+        return position
 
 class CircularTrajectory(Trajectory):
-    def __init__(self, radius: float, direction = "clockwise", start: float = 0, monitor: dict = None) -> None:
+    def __init__(self, radius: float, direction = "clockwise", start: float = 0, monitor: SimpleNamespace = None) -> None:
         super().__init__()
-        if not isinstance(radius, float) and not isinstance(radius, int):
+        if __debug__ and not isinstance(radius, (int, float)):
             raise ValueError("radius_px must be a int or float")
-        if direction not in ["clockwise", "counterclockwise"]:
+        if __debug__ and direction not in ["clockwise", "counterclockwise"]:
             raise ValueError("direction must be 'clockwise' or 'counterclockwise'")
-        if not isinstance(start, float) and not isinstance(start, int):
+        if __debug__ and not isinstance(start, (int, float)):
             raise ValueError("start must be a int or float")
-        if not isinstance(monitor, dict):
-            raise ValueError("monitor must be a dict")
-        if not "distance" in monitor:
-            raise ValueError("monitor must contain a 'distance' key")
-        if not "resolution" in monitor:
-            raise ValueError("monitor must contain a 'resolution' key")
-        if not "height" in monitor:
-            raise ValueError("monitor must contain a 'height' key")
+        if __debug__ and not isinstance(monitor, SimpleNamespace):
+            raise ValueError("monitor must be a SimpleNamespace")
+        if __debug__ and not hasattr(monitor, "distance"):
+            raise ValueError("monitor must contain a 'distance' setting")
+        if __debug__ and not hasattr(monitor, "resolution"):
+            raise ValueError("monitor must contain a 'resolution' setting")
+        if __debug__ and not hasattr(monitor, "height"):
+            raise ValueError("monitor must contain a 'height' setting")
         self.monitor = monitor
-        self.radius = Utilities.px_to_deg(radius, monitor)
         self.radius = radius
         self.direction = direction
         self.start = start
+        self.speed = None # Speed of the last update and its conversion to pixels, only converted again when it changes
+        self.speed_px = None
         
     def update_position(self, 
                         current_position: Tuple[float, float], 
                         time_step: float, 
-                        speed: float) -> Tuple[float, float]: # speed is in degrees per second
+                        speed: float,
+                        _cos=cos, _sin=sin, _radians=radians) -> np.ndarray: # speed is in degrees per second, math functions are bound as locals because this runs every frame
         if self.direction == "clockwise":
-            x = -self.radius * cos(radians(time_step * speed- self.start))
-            print(x)
-            x = -self.radius * cos(radians(time_step * Utilities.deg_to_px(speed, self.monitor) - self.start))
-            print(x, "\n")
-            y = self.radius * sin(radians(time_step * Utilities.deg_to_px(speed, self.monitor) - self.start))
+            if speed != self.speed:
+                self.speed = speed
+                self.speed_px = Utilities.deg_to_px(speed, self.monitor)
+            angle = _radians(time_step * self.speed_px - self.start) # Shared by x and y
+            x = -self.radius * _cos(angle)
+            y = self.radius * _sin(angle)
             #return (deg_to_px(x, self.monitor), deg_to_px(y, self.monitor))
-            return (x, y)
         else:
-            x = self.radius * cos(radians(time_step * speed - self.start))
-            y = self.radius * sin(radians(time_step * speed - self.start))
-            return (Utilities.deg_to_px(x, self.monitor), Utilities.deg_to_px(y, self.monitor))
+            angle = _radians(time_step * speed - self.start) # Shared by x and y
+            x = Utilities.deg_to_px(self.radius * _cos(angle), self.monitor)
+            y = Utilities.deg_to_px(self.radius * _sin(angle), self.monitor)
+        position = self.position
+        position[0] = x
+        position[1] = y
+        return position
 
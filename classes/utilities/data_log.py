@@ -0,0 +1,42 @@
+# Programmer: Luke Korthals, https://github.com/lukekorthals/
+
+# Conversion of the binary data logs written by Experiment to csv files
+# Only depends on numpy, so data logs can be converted without PsychoPy or pylink
+
+# Libraries
+import numpy as np
+import shutil
+
+# Row format line of data logs that hold csv text rows instead of packed rows
+CSV_ROW_FORMAT = "csv"
+
+
+def read_data_log_header(log_path: str) -> tuple:
+    """Returns the line of column names, the row format, and the offset of the first row of a data log"""
+    with open(log_path, "rb") as f:
+        header = f.readline().decode("utf-8").rstrip("\n")
+        row_format = f.readline().decode("ascii").rstrip("\n")
+        return header, row_format, f.tell()
+
+
+def write_data_log_rows(log_path: str, f, row_format: str, offset: int) -> None:
+    """Writes the rows of a data log as csv lines to the binary file f"""
+    if row_format == CSV_ROW_FORMAT:
+        # Text rows are already csv lines
+        with open(log_path, "rb") as log:
+            log.seek(offset)
+            shutil.copyfileobj(log, f)
+    elif row_format:
+        column_codes = row_format[1:]
+        dtype = np.dtype([(f"f{i}", "<i8" if code == "q" else "<f8") for i, code in enumerate(column_codes)])
+        rows = np.fromfile(log_path, dtype=dtype, offset=offset)
+        # %s formats floats like python's repr, which is what csv.writer wrote
+        np.savetxt(f, rows, fmt=["%d" if code == "q" else "%s" for code in column_codes], delimiter=",", newline="\r\n")
+
+
+def convert_data_log_to_csv(log_path: str, csv_path: str) -> None:
+    """Converts a binary data log written by Experiment to a csv file"""
+    header, row_format, offset = read_data_log_header(log_path)
+    with open(csv_path, "wb") as f:
+        f.write(header.encode("utf-8") + b"\r\n") # Write column names to file
+        write_data_log_rows(log_path, f, row_format, offset)
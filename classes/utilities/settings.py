@@ -4,7 +4,17 @@
 
 # Libraries
 import json
+import types
 
-# Load settings from json file
-with open("classes/utilities/settings.json", "r") as f:
-    settings = json.load(f)
+def to_namespace(value):
+    """Converts nested dicts to namespaces so settings can be read as attributes"""
+    if isinstance(value, dict):
+        return types.SimpleNamespace(**{key: to_namespace(item) for key, item in value.items()})
+    return value
+
+# Load settings from json file once
+with open("classes/utilities/settings.json", "r", buffering=1 << 16) as f:
+    settings = to_namespace(json.load(f))
+
+# Text style shared by all instruction screens
+text_settings = settings.stimuli.text
@@ -1,25 +1,74 @@
-import glob
-import re
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache, partial
+import numpy as np
+import os
 import pandas as pd
 import pyreadr
 from math import atan2, degrees
 
+# Column types of the trial and gazehmm csv files, participant ids keep their leading zeros
+CSV_DTYPES = {"participant_id": str}
+# Columns of the gazehmm files that are used, x and y are not parsed
+GAZEHMM_COLUMNS = ["participant_id", "trial_number", "t", "label"]
+# Default csv parser, it applies CSV_DTYPES while parsing so participant ids keep their leading zeros.
+# engine="pyarrow" parses with several threads but converts the types after inferring them
+CSV_ENGINE = "c"
+# Event labels of GazeHMM, the label code is the position in this list
+GAZEHMM_LABELS = ["Blink", "Fixation", "Saccade", "PSO", "Smooth Pursuit"]
+# Maximum number of threads reading csv files at the same time
+MAX_READ_THREADS = 8
+
 class Utilities:
 
+    @staticmethod
+    @lru_cache(maxsize=8)
+    def half_screen_degrees(height, distance):
+        """Visual angle of half the screen height in degrees, computed once per monitor"""
+        return degrees(atan2(.5 * height, distance))
+
     @staticmethod
     def px_to_deg(px, monitor):
-    # px: the number of pixels to convert
+    # px: the number of pixels to convert, also works on numpy arrays
     # monitor: the monitor settings
     # returns: the number of degrees
-        return degrees(atan2(.5 * monitor["height"], monitor["distance"])) / (.5 * monitor["resolution"][1]) * px
+        return Utilities.half_screen_degrees(monitor.height, monitor.distance) / (.5 * monitor.resolution[1]) * px
 
     @staticmethod
     def deg_to_px(deg, monitor):
-        # deg: the number of degrees to convert
+        # deg: the number of degrees to convert, also works on numpy arrays
         # monitor: the monitor settings
         # returns: the number of pixels
-        return (deg / degrees(atan2(.5 * monitor["height"], monitor["distance"])) * (.5 * monitor["resolution"][1]))
+        return (deg / Utilities.half_screen_degrees(monitor.height, monitor.distance) * (.5 * monitor.resolution[1]))
     
+    @staticmethod
+    @lru_cache(maxsize=None)
+    def list_session_files(folder: str, participant_ids: tuple = None):
+        """Lists the csv files in a folder of every session (data/<group>/<participant>/<folder>/*.csv).
+        If participant_ids are given, only the folders of these participants are listed.
+        The listing is cached, call clear_file_cache after files were added or moved"""
+        files = []
+        if not os.path.isdir("data"):
+            return tuple(files)
+        # scandir reads the entry types with the names, so the folders are walked without extra stat calls
+        for group in os.scandir("data"):
+            if group.name.startswith(".") or not group.is_dir():
+                continue
+            if participant_ids:
+                participant_paths = [os.path.join(group.path, participant_id) for participant_id in participant_ids]
+            else:
+                participant_paths = [participant.path for participant in os.scandir(group.path) if not participant.name.startswith(".") and participant.is_dir()]
+            for participant_path in participant_paths:
+                session_folder = os.path.join(participant_path, folder)
+                if os.path.isdir(session_folder):
+                    files.extend(entry.path for entry in os.scandir(session_folder) if entry.name.endswith(".csv") and not entry.name.startswith("."))
+        return tuple(files)
+
+    @staticmethod
+    def clear_file_cache():
+        """Clears the cached file listings and the trial files matched from them"""
+        Utilities.list_session_files.cache_clear()
+        Utilities.find_trial_files.cache_clear()
+
     @staticmethod
     def match_trial_files(participant_ids=None, 
                           target_types=None, 
@@ -31,51 +80,67 @@ class Utilities:
         if trial not in ["both", "first", "second"]:
             raise ValueError("trial has to be 'both', 'first', or 'second'")
         
-        files = glob.glob("data/*/*/trials/*.csv")
+        # The filters are passed as tuples so the matches of repeated calls come from the cache
+        matches = Utilities.find_trial_files(tuple(participant_ids) if participant_ids else None,
+                                             tuple(target_types) if target_types else None,
+                                             tuple(target_trajectories) if target_trajectories else None,
+                                             tuple(target_speeds) if target_speeds else None,
+                                             trial,
+                                             tuple(excluded_participant_ids) if excluded_participant_ids else None)
+        if get_trial_numbers:
+            return sorted({trial_number for _, _, trial_number in matches})
+        return [file for file, _, _ in matches]
 
-        matching_files = []
-        pattern_parts = []
-        
-        if participant_ids:
-            pattern_parts.append(f'({"|".join(participant_ids)})')
-            pattern_parts.append(f'({"|".join(participant_ids)})')
-        else:
-            pattern_parts.append('(.*)')
-            pattern_parts.append('(.*)')
-        
-        if target_types:
-            pattern_parts.append(f'({"|".join(target_types)})')
-        else:
-            pattern_parts.append('(.*)')
-        
-        if target_trajectories:
-            pattern_parts.append(f'({"|".join(target_trajectories)})')
-        else:
-            pattern_parts.append('(.*)')
-        
-        if target_speeds:
-            pattern_parts.append(f'({"|".join(target_speeds)})')
+    @staticmethod
+    @lru_cache(maxsize=128)
+    def find_trial_files(participant_ids: tuple, 
+                         target_types: tuple, 
+                         target_trajectories: tuple, 
+                         target_speeds: tuple, 
+                         trial: str,
+                         excluded_participant_ids: tuple):
+        """Returns the file, participant folder, and trial number of the trial files matching the filters.
+        The matches are cached, call clear_file_cache after files were added or moved"""
+        files = Utilities.list_session_files("trials", participant_ids)
+
+        # Accepted values as sets, None accepts every value
+        participant_ids = set(participant_ids) if participant_ids else None
+        excluded_participant_ids = set(excluded_participant_ids) if excluded_participant_ids else set()
+        target_speeds = set(target_speeds) if target_speeds else None
+        # Types and trajectories contain underscores themselves, so they are compared as one part of the name
+        if target_types and target_trajectories:
+            types_and_trajectories = {f"{target_type}_{target_trajectory}" for target_type in target_types for target_trajectory in target_trajectories}
         else:
-            pattern_parts.append('(.*)')
-        
-        pattern_parts.append('.csv')
-        pattern = r'data\\(\w+)\\{}\\trials\\{}_(\d+)_{}_{}_{}.csv'.format(*pattern_parts)
-        matching_files = [file for file in files if re.match(pattern, file)]
-
-        if trial == "first":
-            matching_files = [file for file in matching_files if int(re.match(r'data\\(\w+)\\{}\\trials\\{}_(\d+)_{}_{}_{}.csv'.format(*pattern_parts), file).group(3)) <= 72]
-        elif trial == "second":
-            matching_files = [file for file in matching_files if int(re.match(r'data\\(\w+)\\{}\\trials\\{}_(\d+)_{}_{}_{}.csv'.format(*pattern_parts), file).group(3)) > 72]
-
-        if excluded_participant_ids:
-            matching_files = [file for file in matching_files if re.match(r'data\\(\w+)\\{}\\trials\\{}_(\d+)_{}_{}_{}.csv'.format(*pattern_parts), file).group(2) not in excluded_participant_ids]
-        
-        if get_trial_numbers:
-            # get the trial number which is the digit after the participant id
-            trial_numbers = list(set([int(file.split("_")[1]) for file in matching_files]))
-            trial_numbers.sort()
-            return trial_numbers
-        return matching_files
+            types_and_trajectories = None
+        type_prefixes = tuple(f"{target_type}_" for target_type in target_types) if target_types else ""
+        trajectory_suffixes = tuple(f"_{target_trajectory}" for target_trajectory in target_trajectories) if target_trajectories else ""
+
+        # Parse every file name once and keep the participant id and trial number of the matching files
+        matches = []
+        for file in files:
+            # Paths are data/<group>/<participant folder>/trials/<file name>
+            participant_folder, _, file_name = file.split(os.sep)[-3:]
+            # File names are <participant id>_<trial number>_<target type>_<target trajectory>_<target speed>.csv
+            name_parts = file_name[:-len(".csv")].split("_", 2)
+            if len(name_parts) < 3:
+                continue
+            participant_id, trial_number, type_and_trajectory = name_parts
+            type_and_trajectory, _, speed = type_and_trajectory.rpartition("_")
+            if not trial_number.isdigit() or "_" not in type_and_trajectory:
+                continue
+            if participant_ids and participant_id not in participant_ids or participant_folder in excluded_participant_ids:
+                continue
+            if target_speeds and speed not in target_speeds:
+                continue
+            if types_and_trajectories and type_and_trajectory not in types_and_trajectories:
+                continue
+            if not type_and_trajectory.startswith(type_prefixes) or not type_and_trajectory.endswith(trajectory_suffixes):
+                continue
+            trial_number = int(trial_number)
+            if trial == "first" and trial_number > 72 or trial == "second" and trial_number <= 72:
+                continue
+            matches.append((file, participant_folder, trial_number))
+        return tuple(matches)
 
     @staticmethod
     def rename_to_readable_values(dat: pd.DataFrame):
@@ -99,79 +164,75 @@ class Utilities:
             "diag_down_left": "Diagonal Down Left ↙",
             "diag_down_right": "Diagonal Down Right ↘"
         }
-        dat.loc[:, "target_speed"] = dat["target_speed"].map(target_speed)
-        dat.loc[:, "target_type"] = dat["target_type"].map(target_type)
-        dat.loc[:, "target_trajectory"] = dat["target_trajectory"].map(target_trajectory)
+        # Stored as categories, so every readable value is created once instead of once per row
+        for column, readable_values in (("target_speed", target_speed), ("target_type", target_type), ("target_trajectory", target_trajectory)):
+            dat[column] = pd.Categorical(dat[column], categories=list(readable_values)).rename_categories(list(readable_values.values()))
         return dat
     
     @staticmethod
-    def match_trial_files_by_trial_number(participant_ids=None, trial_numbers=None):
-        "Matches trial files by participant id and trial number"
-        files = glob.glob("data/*/*/trials/*.csv")
+    def match_files_by_trial_number(files, participant_ids=None, trial_numbers=None, file_name_end=None):
+        """Keeps the session files of the participant ids and trial numbers.
+        File names are <participant id>_<trial number>_<file_name_end>, any end is accepted if file_name_end is None"""
+        # Accepted values as sets, None accepts every value
+        participant_ids = set(participant_ids) if participant_ids else None
+        trial_numbers = {str(trial_number) for trial_number in trial_numbers} if trial_numbers else None
         matching_files = []
-        pattern_parts = []
-
-        if participant_ids:
-                pattern_parts.append(f'({"|".join(participant_ids)})')
-                pattern_parts.append(f'({"|".join(participant_ids)})')
-        else:
-            pattern_parts.append('(.*)')
-            pattern_parts.append('(.*)')
-
-        if trial_numbers: 
-            pattern_parts.append(f'({"|".join(trial_numbers)})')
-        else:
-            pattern_parts.append('(.*)')
-
-        pattern_parts.append('.csv')
-        pattern = r'data\\(\w+)\\{}\\trials\\{}_{}_(.*).csv'.format(*pattern_parts)
-        matching_files = [file for file in files if re.match(pattern, file)]
+        for file in files:
+            # Paths are data/<group>/<participant folder>/<session folder>/<file name>
+            participant_folder, _, file_name = file.split(os.sep)[-3:]
+            name_parts = file_name.split("_", 2)
+            if len(name_parts) < 3:
+                continue
+            participant_id, trial_number, name_end = name_parts
+            if participant_ids and (participant_folder not in participant_ids or participant_id not in participant_ids):
+                continue
+            if trial_numbers and trial_number not in trial_numbers:
+                continue
+            if file_name_end is not None and name_end != file_name_end:
+                continue
+            matching_files.append(file)
         return matching_files
+
+    @staticmethod
+    def match_trial_files_by_trial_number(participant_ids=None, trial_numbers=None):
+        "Matches trial files by participant id and trial number"
+        files = Utilities.list_session_files("trials", tuple(participant_ids) if participant_ids else None)
+        return Utilities.match_files_by_trial_number(files, participant_ids, trial_numbers)
     
+    @staticmethod
+    def read_csv_files(files, **read_csv_kwargs):
+        """Reads csv files in parallel and concatenates them in the order of files"""
+        # read_csv releases the GIL while parsing, so several threads can parse files at the same time
+        with ThreadPoolExecutor(max_workers=min(MAX_READ_THREADS, os.cpu_count() or 1)) as executor:
+            frames = executor.map(partial(pd.read_csv, **read_csv_kwargs), files)
+            return pd.concat(frames, ignore_index=True)
+
     @staticmethod 
-    def read_files(files):
-        dat = pd.concat([pd.read_csv(file, dtype={"participant_id": str}) for file in files])
+    def read_files(files, engine: str = CSV_ENGINE):
+        dat = Utilities.read_csv_files(files, dtype=CSV_DTYPES, engine=engine)
         return dat
     
     @staticmethod
-    def read_gazehmm_files(participant_ids: list = None, trial_numbers: list = None):
+    def read_gazehmm_files(participant_ids: list = None, trial_numbers: list = None, engine: str = CSV_ENGINE):
         """Reads the RDS files according to the participant ids and trial numbers."""
-        files = glob.glob("data/*/*/gazehmm/*.csv")
-        matching_files = []
-        pattern_parts = []
-
-        if participant_ids:
-                pattern_parts.append(f'({"|".join(participant_ids)})')
-                pattern_parts.append(f'({"|".join(participant_ids)})')
-        else:
-            pattern_parts.append('(.*)')
-            pattern_parts.append('(.*)')
-
-        if trial_numbers: 
-            pattern_parts.append(f'({"|".join(trial_numbers)})')
-        else:
-            pattern_parts.append('(.*)')
-
-        pattern_parts.append('.rds')
-        pattern = r'data\\(\w+)\\{}\\gazehmm\\{}_{}_gazehmm.csv'.format(*pattern_parts)
-        matching_files = [file for file in files if re.match(pattern, file)]
-        dat = pd.concat([pd.read_csv(file, dtype={"participant_id": str}) for file in matching_files])
+        files = Utilities.list_session_files("gazehmm", tuple(participant_ids) if participant_ids else None)
+        matching_files = Utilities.match_files_by_trial_number(files, participant_ids, trial_numbers, file_name_end="gazehmm.csv")
+        # Labels are not read as integers, a file with missing labels would fail to load
+        dat = Utilities.read_csv_files(matching_files, dtype=CSV_DTYPES, usecols=GAZEHMM_COLUMNS, engine=engine)
         # rename time column to match the trial data
         dat = dat.rename(columns={"t": "trial_time"})
-        # drop x and y columns
-        dat = dat.drop(columns=["x", "y"])
-        # change label values 
-        dat.loc[:, "label"] = dat["label"].map({0: "Blink", 
-                                                1: "Fixation", 
-                                                2: "Saccade",
-                                                3: "PSO",
-                                                4: "Smooth Pursuit"})
+        # change label codes to label names, the codes are the positions of the names so they are used as categorical codes directly
+        codes = pd.to_numeric(dat["label"], errors="coerce").to_numpy(dtype="float64", na_value=np.nan)
+        # Missing, non-integer, and unknown codes become -1, which is NaN in the categorical
+        codes = np.where((codes >= 0) & (codes < len(GAZEHMM_LABELS)) & (codes % 1 == 0), codes, -1).astype("int8")
+        dat["label"] = pd.Categorical.from_codes(codes, categories=GAZEHMM_LABELS)
         return dat
     
     @staticmethod
     def combine_trial_and_gazehmm_data(trial_data, gazehmm_data):
         """Merges the trial data and the gazehmm data."""
-        dat = pd.merge(trial_data, gazehmm_data, on=["participant_id", "trial_number", "trial_time"])
+        # Every sample of a trial has one gazehmm label, validate raises if a sample is duplicated
+        dat = pd.merge(trial_data, gazehmm_data, on=["participant_id", "trial_number", "trial_time"], how="inner", validate="1:1")
         return dat
 
 
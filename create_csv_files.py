@@ -0,0 +1,26 @@
+# Programmer: Luke Korthals, https://github.com/lukekorthals/
+# Convert the binary data logs of sessions that did not finish to csv files
+
+# Libraries
+from concurrent.futures import ProcessPoolExecutor
+import glob
+import os
+
+# Local imports
+from classes.utilities.data_log import convert_data_log_to_csv
+
+
+def convert_data_log(log_path: str) -> str:
+    """Converts a data log next to its session files, removes the log, and returns the csv path"""
+    csv_path = log_path[:-len("_data.log")] + ".csv"
+    convert_data_log_to_csv(log_path, csv_path)
+    os.remove(log_path) # Like finalize_experiment, so a log is only converted once
+    return csv_path
+
+
+if __name__ == "__main__":
+    log_paths = glob.glob("data/**/*_data.log", recursive=True)
+    # Every log is independent, so they are converted in parallel processes
+    with ProcessPoolExecutor() as executor:
+        for csv_path in executor.map(convert_data_log, log_paths, chunksize=8):
+            print(csv_path)
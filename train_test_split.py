@@ -3,15 +3,15 @@ import os
 
 np.random.seed(1)
 data_dir = ("data")
-participant_ids = [folder for folder in os.listdir(data_dir) if os.path.isdir(os.path.join(data_dir, folder)) if folder != "pilot" and folder != "excluded"]
+# scandir returns the entry type with the name, so no extra stat call is needed per folder
+with os.scandir(data_dir) as entries:
+    participant_ids = [entry.name for entry in entries if entry.is_dir() and entry.name not in ("pilot", "excluded", "train", "test")]
 train_ids = np.random.choice(participant_ids, size=7, replace=False)
 test_ids = [id for id in participant_ids if id not in train_ids]
 
 # Create new folder data/train and data/test
-if not os.path.exists("data/train"):
-    os.makedirs("data/train")
-if not os.path.exists("data/test"):
-    os.makedirs("data/test")
+os.makedirs("data/train", exist_ok=True)
+os.makedirs("data/test", exist_ok=True)
 
 # Move data into train and test folders
 for id in train_ids: